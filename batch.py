@@ -0,0 +1,172 @@
+# batch.py
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import IMAGE_SIZE, get_engine, load_image_array
+from prediction_cache import hash_image_bytes
+from results_store import DB_FILE, ResultsStore, make_record
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def iter_image_paths(directory):
+    """Yield image files under directory (recursively) in a stable order"""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def count_images(directory):
+    """Count image files under directory without decoding them"""
+    return sum(1 for _ in iter_image_paths(directory))
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def decode_image_bytes(data):
+    """Hash and decode the bytes of an image file; (hash, uint8 array), or None if unreadable"""
+    try:
+        return hash_image_bytes(data), load_image_array(io.BytesIO(data))
+    except Exception:
+        return None
+
+
+def _decode(path):
+    """Read a file once, returning its content hash and decoded array (None if unreadable)"""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+    return decode_image_bytes(data)
+
+
+def _decode_chunk(executor, paths):
+    """Decode a chunk of paths in parallel and stack them into one uint8 batch"""
+    decoded = list(executor.map(_decode, paths))
+    good = [(p, d) for p, d in zip(paths, decoded) if d is not None]
+    failed = [p for p, d in zip(paths, decoded) if d is None]
+    if good:
+        batch = np.stack([d[1] for _, d in good])
+    else:
+        batch = np.zeros((0,) + IMAGE_SIZE + (3,), dtype=np.uint8)
+    return [p for p, _ in good], [d[0] for _, d in good], batch, failed
+
+
+def score_batches(paths, engine, batch_size=32, workers=None):
+    """Predict an iterable of image paths in fixed-size batches
+
+    Yields (paths, hashes, probabilities, failed) per batch. Decoding of the
+    next batch overlaps with inference on the current one, so at most two
+    batches are held in memory however many paths there are.
+    """
+    if workers is None:
+        workers = min(8, os.cpu_count() or 1)
+
+    # One thread assembles the next batch while the decoder pool fills it
+    with ThreadPoolExecutor(max_workers=workers) as decoders, \
+            ThreadPoolExecutor(max_workers=1) as prefetcher:
+        chunks = _chunks(paths, batch_size)
+        pending = None
+        first = next(chunks, None)
+        if first is not None:
+            pending = prefetcher.submit(_decode_chunk, decoders, first)
+
+        while pending is not None:
+            good, hashes, batch, bad = pending.result()
+            following = next(chunks, None)
+            pending = prefetcher.submit(_decode_chunk, decoders, following) if following else None
+
+            probabilities = []
+            if len(good):
+                # Pad the last batch so the network always sees the same shape
+                padding = batch_size - len(good)
+                if padding > 0:
+                    batch = np.concatenate([batch, np.zeros((padding,) + batch.shape[1:], dtype=batch.dtype)])
+                probabilities = engine.predict_batch(batch)[:len(good)]
+            yield good, hashes, probabilities, bad
+
+
+def score_folder(directory, engine=None, batch_size=32, workers=None,
+                 store=None, progress=None):
+    """Predict every image under directory in fixed-size batches (see score_batches)
+
+    Results are written to the results store in one transaction per batch;
+    store may also be a BufferedResultWriter shared with other producers.
+    Returns a summary with counts and throughput.
+    """
+    if engine is None:
+        engine = get_engine()
+    engine.load()
+    own_store = store is None
+    if own_store:
+        store = ResultsStore(DB_FILE)
+
+    total = count_images(directory)
+    scored = 0
+    failed = []
+    start = time.perf_counter()
+
+    for paths, hashes, probabilities, bad in score_batches(iter_image_paths(directory), engine,
+                                                           batch_size, workers):
+        failed.extend(bad)
+        if len(paths):
+            store.add_many([make_record(p, prob, h) for p, prob, h in zip(paths, probabilities, hashes)])
+            scored += len(paths)
+
+        if progress:
+            done = scored + len(failed)
+            rate = scored / max(time.perf_counter() - start, 1e-9)
+            progress(int(done * 100 / max(total, 1)),
+                     f"Analyzed {done}/{total} images ({rate:.1f} img/s)")
+
+    elapsed = time.perf_counter() - start
+    if own_store:
+        store.close()
+    return {
+        "directory": directory,
+        "total": total,
+        "scored": scored,
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_second": scored / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every image in a folder")
+    parser.add_argument("directory", help="Folder containing lesion images")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel image decoders")
+    parser.add_argument("--db", default=DB_FILE, help="Results database to write to")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    summary = score_folder(args.directory, batch_size=args.batch_size,
+                           workers=args.workers, store=store,
+                           progress=lambda value, text: print(text))
+    store.close()
+    print(f"Scored {summary['scored']} images in {summary['seconds']:.1f}s "
+          f"({summary['images_per_second']:.1f} images/s)")
+    for path in summary["failed"]:
+        print(f"Could not read: {path}")
+
+
+if __name__ == "__main__":
+    main()
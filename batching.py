@@ -0,0 +1,162 @@
+# batching.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 10
+LATENCY_WINDOW = 1000  # recent requests kept for the latency percentiles
+
+
+class SchedulerFull(Exception):
+    """Raised when a bounded scheduler has no room for more requests"""
+
+
+class MicroBatchScheduler:
+    """Gathers single requests from many threads into batched model calls
+
+    predict_batch receives a list of queued items and must return one
+    result per item. A batch is run as soon as max_batch_size items are
+    waiting, or max_wait_ms after the oldest of them was submitted. Larger
+    waits give bigger batches and more throughput at the cost of latency;
+    metrics() reports both so the two settings can be tuned.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_queue=None, name="micro-batch"):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self.items = 0
+        self.batches = 0
+        self.rejected = 0
+        self.compute_seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = {}
+        self._started = time.perf_counter()
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result"""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items):
+        """Queue several items at once; either all are accepted or SchedulerFull is raised
+
+        More items than max_queue could never be accepted, so they raise
+        ValueError rather than SchedulerFull.
+        """
+        if self.max_queue is not None and len(items) > self.max_queue:
+            raise ValueError(f"Cannot queue {len(items)} items at once, the limit is {self.max_queue}")
+        futures = [Future() for _ in items]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The scheduler is closed")
+            if self.max_queue is not None and len(self._pending) + len(items) > self.max_queue:
+                self.rejected += 1
+                raise SchedulerFull(f"{len(self._pending)} requests are already waiting")
+            now = time.perf_counter()
+            self._pending.extend((item, future, now) for item, future in zip(items, futures))
+            self._condition.notify()
+        return futures
+
+    def predict(self, item, timeout=None):
+        """Submit one item and wait for its result"""
+        return self.submit(item).result(timeout)
+
+    def pending(self):
+        """Number of items waiting for a batch"""
+        return len(self._pending)
+
+    def metrics(self):
+        """Throughput, batch size and latency figures since the scheduler started"""
+        with self._condition:
+            latencies = sorted(self._latencies)
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+        elapsed = time.perf_counter() - self._started
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "items": self.items,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_sizes": batch_sizes,
+            "items_per_second": self.items / elapsed if elapsed > 0 else 0.0,
+            "compute_items_per_second": self.items / self.compute_seconds if self.compute_seconds else 0.0,
+            "latency_ms": {
+                "p50": _percentile(latencies, 50) * 1000,
+                "p95": _percentile(latencies, 95) * 1000,
+                "p99": _percentile(latencies, 99) * 1000
+            }
+        }
+
+    def close(self, wait=True):
+        """Stop accepting items; queued items are still run"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if wait:
+            self._thread.join()
+
+    def _next_batch(self):
+        """Block until a batch is due and take it off the queue (None once closed and empty)"""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            count = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Callers may have cancelled while waiting
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.predict_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"predict_batch returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            end = time.perf_counter()
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+            with self._condition:
+                self.items += len(batch)
+                self.batches += 1
+                self.compute_seconds += end - start
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._latencies.extend(end - submitted for _, _, submitted in batch)
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
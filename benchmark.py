@@ -0,0 +1,227 @@
+# benchmark.py
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from inference import IMAGE_SIZE, KerasBackend, SavedModelBackend, TFLiteBackend, load_image_array
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+BACKENDS = ("keras", "savedmodel", "tflite-float", "tflite-int8")
+MODELS_DIR = "benchmark_models"
+RESULTS_FILE = "benchmark_results.json"
+SEED = 1234
+
+
+def default_thread_counts():
+    cores = os.cpu_count() or 1
+    return sorted({n for n in (1, 2, 4, cores) if n <= cores})
+
+
+def sample_images(count, images_dir=None, seed=SEED):
+    """(count, 224, 224, 3) uint8 images from images_dir, or synthetic noise if none is given"""
+    if images_dir:
+        from batch import iter_image_paths
+
+        paths = list(iter_image_paths(images_dir))[:count]
+        if not paths:
+            raise ValueError(f"No images found in {images_dir}")
+        images = np.stack([load_image_array(p) for p in paths])
+        # Repeat the sample to fill the largest batch
+        return images[np.arange(count) % len(images)]
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(count,) + IMAGE_SIZE + (3,), dtype=np.uint8)
+
+
+def prepare_models(model_path=None, out_dir=MODELS_DIR, head="flatten", images=None):
+    """Write the model in every benchmarked format and return {backend: path}
+
+    Without model_path the benchmark runs the untrained network from
+    create_model; speed does not depend on the weights.
+    """
+    import tensorflow as tf
+
+    from export_tflite import convert
+    from model import create_model
+
+    os.makedirs(out_dir, exist_ok=True)
+    if model_path:
+        model = tf.keras.models.load_model(model_path, compile=False)
+    else:
+        tf.keras.utils.set_random_seed(SEED)
+        model = create_model(IMAGE_SIZE + (3,), head=head)
+
+    paths = {
+        "keras": os.path.join(out_dir, "model.h5"),
+        "savedmodel": os.path.join(out_dir, "saved_model"),
+        "tflite-float": os.path.join(out_dir, "model_float.tflite"),
+        "tflite-int8": os.path.join(out_dir, "model_int8.tflite")
+    }
+    model.save(paths["keras"])
+    tf.saved_model.save(model, paths["savedmodel"])
+    for variant in ("float", "int8"):
+        with open(paths[f"tflite-{variant}"], 'wb') as file:
+            file.write(convert(model, variant, calibration_images=images))
+    return paths
+
+
+def time_batches(backend, images, batch_sizes, iterations, warmup):
+    """Latency percentiles and throughput of backend.predict_batch for each batch size"""
+    results = []
+    for batch_size in batch_sizes:
+        batch = images[:batch_size].astype(np.float32) / 255.0
+        for _ in range(warmup):
+            backend.predict_batch(batch)
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            backend.predict_batch(batch)
+            latencies.append(time.perf_counter() - start)
+        latencies = np.asarray(latencies) * 1000
+        results.append({
+            "batch_size": batch_size,
+            "iterations": iterations,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_ms": float(latencies.mean()),
+            "images_per_second": float(batch_size * 1000 / latencies.mean())
+        })
+    return results
+
+
+def run_worker(backend_name, model_path, threads, batch_sizes, iterations, warmup, images_dir):
+    """Benchmark one backend at one thread count (meant to run in its own process)"""
+    if backend_name.startswith("tflite"):
+        backend = TFLiteBackend(model_path, num_threads=threads)
+    else:
+        # Thread pools can only be sized before TensorFlow starts, hence one process per run
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        backend = (KerasBackend if backend_name == "keras" else SavedModelBackend)(model_path)
+
+    start = time.perf_counter()
+    backend.load()
+    load_seconds = time.perf_counter() - start
+    images = sample_images(max(batch_sizes), images_dir)
+    return {
+        "backend": backend_name,
+        "threads": threads,
+        "load_seconds": load_seconds,
+        "batches": time_batches(backend, images, batch_sizes, iterations, warmup)
+    }
+
+
+def run_benchmark(model_path=None, backends=BACKENDS, batch_sizes=BATCH_SIZES, thread_counts=None,
+                  iterations=20, warmup=3, images_dir=None, models_dir=MODELS_DIR):
+    """Run every backend and thread count in a fresh subprocess and collect a JSON report"""
+    thread_counts = thread_counts or default_thread_counts()
+    calibration = sample_images(100, images_dir)
+    paths = prepare_models(model_path, models_dir, images=calibration)
+
+    runs = []
+    for backend_name in backends:
+        for threads in thread_counts:
+            print(f"Benchmarking {backend_name} with {threads} threads...", flush=True)
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as file:
+                output = file.name
+            command = [sys.executable, os.path.abspath(__file__), "--worker", backend_name,
+                       "--worker-model", paths[backend_name], "--worker-output", output,
+                       "--threads", str(threads), "--iterations", str(iterations),
+                       "--warmup", str(warmup), "--batch-sizes", *map(str, batch_sizes)]
+            if images_dir:
+                command += ["--images", images_dir]
+            env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="2")
+            try:
+                completed = subprocess.run(command, env=env, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    runs.append({"backend": backend_name, "threads": threads,
+                                 "error": completed.stderr.strip().splitlines()[-1:]})
+                    continue
+                with open(output) as file:
+                    runs.append(json.load(file))
+            finally:
+                os.remove(output)
+
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "model": model_path or "untrained create_model()",
+        "images": images_dir or "synthetic",
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "runs": runs
+    }
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Return (backend, threads, batch size, old, new) for throughputs that dropped by more than tolerance"""
+    old = {(r["backend"], r["threads"], b["batch_size"]): b["images_per_second"]
+           for r in baseline["runs"] if "batches" in r for b in r["batches"]}
+    regressions = []
+    for run in report["runs"]:
+        for b in run.get("batches", []):
+            key = (run["backend"], run["threads"], b["batch_size"])
+            if key in old and b["images_per_second"] < old[key] * (1 - tolerance):
+                regressions.append(key + (old[key], b["images_per_second"]))
+    return regressions
+
+
+def print_report(report):
+    print(f"{'Backend':14s}{'Threads':>8s}{'Batch':>7s}{'p50 ms':>10s}{'p95 ms':>10s}{'p99 ms':>10s}{'img/s':>10s}")
+    for run in report["runs"]:
+        if "error" in run:
+            print(f"{run['backend']:14s}{run['threads']:>8d}  failed: {' '.join(run['error'])}")
+            continue
+        for b in run["batches"]:
+            print(f"{run['backend']:14s}{run['threads']:>8d}{b['batch_size']:>7d}{b['p50_ms']:>10.1f}"
+                  f"{b['p95_ms']:>10.1f}{b['p99_ms']:>10.1f}{b['images_per_second']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CNN inference across backends, batch sizes and threads")
+    parser.add_argument("--model", help="Trained .h5 model (default: untrained create_model network)")
+    parser.add_argument("--images", help="Folder of sample images (default: synthetic images)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=list(BATCH_SIZES))
+    parser.add_argument("--threads", nargs="+", type=int, help="Intra-op thread counts to try")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", help="Earlier results file; exit 1 if throughput regressed")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed throughput drop vs the baseline")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-model", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.worker_model, args.threads[0], args.batch_sizes,
+                            args.iterations, args.warmup, args.images)
+        with open(args.worker_output, 'w') as file:
+            json.dump(result, file)
+        sys.exit(0)
+
+    report = run_benchmark(args.model, args.backends, args.batch_sizes, args.threads,
+                           args.iterations, args.warmup, args.images, args.models_dir)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print_report(report)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for backend, threads, batch_size, old, new in regressions:
+            print(f"Regression: {backend} threads={threads} batch={batch_size}: "
+                  f"{old:.1f} -> {new:.1f} images/s")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,227 @@
+# cli.py
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+
+# Plots from training must not pull in a GUI toolkit on headless machines
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from results_store import DB_FILE
+
+
+def emit(record):
+    """Write one JSON Lines record to stdout straight away"""
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def expand_inputs(inputs):
+    """Yield image files from a mix of file paths, glob patterns and directories"""
+    from batch import IMAGE_EXTENSIONS, iter_image_paths
+
+    for item in inputs:
+        if os.path.isdir(item):
+            yield from iter_image_paths(item)
+        elif glob.has_magic(item):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isdir(path):
+                    yield from iter_image_paths(path)
+                elif path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield path
+        else:
+            yield item
+
+
+def cmd_predict(args):
+    from batch import score_batches
+    from inference import MODEL_PATH, get_engine
+    from results_store import BufferedResultWriter, make_record, open_store
+
+    # stdout carries only the JSON Lines records, e.g. not the legacy CSV import message
+    with contextlib.redirect_stdout(sys.stderr):
+        engine = get_engine(args.model or MODEL_PATH, args.backend)
+        engine.load()
+        store = open_store(args.db) if args.save else None
+    writer = BufferedResultWriter(store) if store else None
+
+    if args.tta:
+        return _predict_tta(args, engine, writer, store)
+
+    failures = 0
+    try:
+        for paths, hashes, probabilities, bad in score_batches(expand_inputs(args.inputs), engine,
+                                                               args.batch_size, args.workers):
+            records = [make_record(p, prob, h) for p, prob, h in zip(paths, probabilities, hashes)]
+            for timestamp, path, image_hash, label, confidence, probability in records:
+                emit({"image": path, "prediction": label, "confidence": confidence,
+                      "probability": probability, "image_hash": image_hash})
+            for path in bad:
+                emit({"image": path, "error": "Could not read image"})
+            failures += len(bad)
+            if writer and records:
+                writer.add_many(records)
+    finally:
+        if writer:
+            try:
+                writer.close()
+            finally:
+                store.close()
+    return 1 if failures else 0
+
+
+def _predict_tta(args, engine, writer, store):
+    """Predict one image at a time, each as a batch of augmented views"""
+    from inference import load_image_array
+    from prediction_cache import hash_image_bytes
+    from results_store import make_record
+
+    failures = 0
+    first = True
+    try:
+        for path in expand_inputs(args.inputs):
+            try:
+                with open(path, 'rb') as file:
+                    image_hash = hash_image_bytes(file.read())
+                image = load_image_array(path)
+            except Exception as e:
+                emit({"image": path, "error": f"Could not read image: {e}"})
+                failures += 1
+                continue
+
+            if first:
+                first = False
+                overhead = engine.tta_overhead(image, args.tta_views)
+                print(f"TTA with {args.tta_views} views: {overhead['tta_ms']:.1f} ms vs "
+                      f"{overhead['single_ms']:.1f} ms single view "
+                      f"(+{overhead['overhead_ms']:.1f} ms, {overhead['overhead_ratio']:.1f}x)", file=sys.stderr)
+
+            probability, spread = engine.predict_tta(image, args.tta_views)
+            record = make_record(path, probability, image_hash)
+            _, _, _, label, confidence, probability = record
+            emit({"image": path, "prediction": label, "confidence": confidence,
+                  "probability": probability, "image_hash": image_hash,
+                  "tta_views": args.tta_views, "tta_spread": spread,
+                  "latency_ms": engine.last_latency * 1000})
+            if writer:
+                writer.add_many([record])
+    finally:
+        if writer:
+            try:
+                writer.close()
+            finally:
+                store.close()
+    return 1 if failures else 0
+
+
+def cmd_train(args):
+    from model import train_model
+
+    # Keras progress output goes to stderr so stdout stays JSON Lines
+    with contextlib.redirect_stdout(sys.stderr):
+        model = train_model(args.dataset_path, args.config, batch_size=args.batch_size,
+                            epochs=args.epochs, learning_rate=args.learning_rate, head=args.head,
+                            dropout=args.dropout,
+                            cache=args.cache, shards_dir=args.shards_dir, model_path=args.model_path)
+    history = model.history.history if model.history else {}
+    emit({"model_path": args.model_path or "monkeypox_model.h5",
+          "epochs": len(history.get("loss", [])),
+          **{key: values[-1] for key, values in history.items() if values}})
+    return 0
+
+
+def cmd_export(args):
+    from export_tflite import VARIANTS, evaluate_accuracy, export_tflite
+
+    with contextlib.redirect_stdout(sys.stderr):
+        exported = export_tflite(args.model, args.dataset, args.out_dir,
+                                 args.variants or VARIANTS, args.calibration_images)
+    for variant, path in exported.items():
+        emit({"variant": variant, "path": path, "size_bytes": os.path.getsize(path)})
+
+    if args.evaluate:
+        with contextlib.redirect_stdout(sys.stderr):
+            report = evaluate_accuracy({"keras": args.model, **exported}, args.dataset)
+        for name, row in report.items():
+            emit({"model": name, **row})
+    return 0
+
+
+def cmd_benchmark(args):
+    from benchmark import BACKENDS, BATCH_SIZES, run_benchmark
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmark(args.model, args.backends or BACKENDS, args.batch_sizes or BATCH_SIZES,
+                               args.threads, args.iterations, images_dir=args.images)
+    for run in report["runs"]:
+        for row in run.get("batches", [{}]):
+            emit({"backend": run["backend"], "threads": run["threads"], **row,
+                  **({"error": run["error"]} if "error" in run else {})})
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Monkeypox detector without the GUI; results are printed as JSON Lines"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    predict = commands.add_parser("predict", help="Predict image files, glob patterns or directories")
+    predict.add_argument("inputs", nargs="+")
+    predict.add_argument("--model", help="Model file (default: $MONKEYPOX_MODEL or monkeypox_model.h5)")
+    predict.add_argument("--backend", choices=["keras", "savedmodel", "tflite"])
+    predict.add_argument("--batch-size", type=int, default=32)
+    predict.add_argument("--workers", type=int, help="Parallel image decoders")
+    predict.add_argument("--tta", action="store_true", help="Average flipped and cropped views of each image")
+    predict.add_argument("--tta-views", type=int, default=8, help="Number of views for --tta (1-8)")
+    predict.add_argument("--save", action="store_true", help="Also record the results in the results database")
+    predict.add_argument("--db", default=DB_FILE)
+    predict.set_defaults(func=cmd_predict)
+
+    train = commands.add_parser("train", help="Train the CNN (see model.py for all options)")
+    train.add_argument("dataset_path", nargs="?", default="data/dataset")
+    train.add_argument("--config", help="JSON file with training settings")
+    train.add_argument("--batch-size", type=int)
+    train.add_argument("--epochs", type=int)
+    train.add_argument("--learning-rate", type=float)
+    train.add_argument("--head", choices=["flatten", "gap"])
+    train.add_argument("--dropout", type=float)
+    train.add_argument("--cache", help='"memory" or a cache directory')
+    train.add_argument("--shards-dir")
+    train.add_argument("--model-path")
+    train.set_defaults(func=cmd_train)
+
+    export = commands.add_parser("export", help="Export the model to TFLite")
+    export.add_argument("--model", default="monkeypox_model.h5")
+    export.add_argument("--dataset", default="data/dataset", help="Used for calibration and evaluation")
+    export.add_argument("--out-dir", default=".")
+    export.add_argument("--variants", nargs="+", choices=["float", "dynamic", "int8"])
+    export.add_argument("--calibration-images", type=int, default=100)
+    export.add_argument("--evaluate", action="store_true", help="Compare accuracy on the validation split")
+    export.set_defaults(func=cmd_export)
+
+    benchmark = commands.add_parser("benchmark", help="Benchmark inference speed")
+    benchmark.add_argument("--model", help="Trained .h5 model (default: untrained network)")
+    benchmark.add_argument("--images", help="Folder of sample images (default: synthetic)")
+    benchmark.add_argument("--backends", nargs="+", choices=["keras", "savedmodel", "tflite-float", "tflite-int8"])
+    benchmark.add_argument("--batch-sizes", nargs="+", type=int)
+    benchmark.add_argument("--threads", nargs="+", type=int)
+    benchmark.add_argument("--iterations", type=int, default=20)
+    benchmark.add_argument("--output", help="Also write the full JSON report here")
+    benchmark.set_defaults(func=cmd_benchmark)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# compare_heads.py
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import build_datasets
+from model import HEADS, compile_model, create_model
+
+
+def measure_head(head, train_dataset=None, validation_dataset=None, epochs=5, latency_runs=50):
+    """Return size, load time, latency and (optionally) accuracy for one classifier head"""
+    model = compile_model(create_model(head=head))
+
+    result = {"head": head, "parameters": model.count_params()}
+
+    if train_dataset is not None:
+        model.fit(train_dataset, validation_data=validation_dataset, epochs=epochs, verbose=2)
+        _, accuracy = model.evaluate(validation_dataset, verbose=0)
+        result["val_accuracy"] = float(accuracy)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{head}.h5")
+        model.save(path)
+        result["h5_mb"] = os.path.getsize(path) / (1024 * 1024)
+
+        start = time.perf_counter()
+        loaded = tf.keras.models.load_model(path, compile=False)
+        result["load_seconds"] = time.perf_counter() - start
+
+    # Per-image CPU latency (batch of one, after a warm-up call)
+    image = np.random.rand(1, 224, 224, 3).astype(np.float32)
+    loaded(image, training=False)
+    timings = []
+    for _ in range(latency_runs):
+        start = time.perf_counter()
+        loaded(image, training=False)
+        timings.append(time.perf_counter() - start)
+    result["latency_ms"] = float(np.median(timings) * 1000)
+    return result
+
+
+def compare_heads(dataset_path=None, epochs=5, batch_size=32):
+    """Print a side by side comparison of every head in model.HEADS"""
+    train_dataset = validation_dataset = None
+    if dataset_path:
+        train_dataset, validation_dataset = build_datasets(dataset_path, batch_size, cache="memory")
+
+    results = [measure_head(head, train_dataset, validation_dataset, epochs) for head in HEADS]
+
+    print(f"{'Head':10s}{'Params':>14s}{'.h5 MB':>10s}{'Load s':>10s}{'Latency ms':>12s}{'Val acc':>10s}")
+    for r in results:
+        accuracy = f"{r['val_accuracy']:.3f}" if "val_accuracy" in r else "-"
+        print(f"{r['head']:10s}{r['parameters']:>14,d}{r['h5_mb']:>10.1f}"
+              f"{r['load_seconds']:>10.2f}{r['latency_ms']:>12.1f}{accuracy:>10s}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the create_model classifier heads")
+    parser.add_argument("dataset_path", nargs="?", default=None,
+                        help="Train each head on this dataset to compare validation accuracy")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    compare_heads(args.dataset_path, args.epochs, args.batch_size)
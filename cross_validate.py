@@ -0,0 +1,162 @@
+# cross_validate.py
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import split_files
+from dataset_shards import SHARDS_DIR, ShardReader, build_shards, shard_dataset
+from model import HEADS, compile_model, create_model
+from training_config import apply_runtime_config, child_thread_limit, load_config, split_cores, worker_config
+
+FOLDS = 5
+EARLY_STOPPING_SPLIT = 0.1  # share of each fold's training images used to decide when to stop
+REPORT_FILE = "cross_validation.json"
+METRICS = ("val_loss", "val_accuracy", "sensitivity", "specificity")
+
+
+def stratified_folds(labels, k=FOLDS, seed=0):
+    """Deal sample indices into k folds that each keep the class balance of the whole set"""
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    folds = [[] for _ in range(k)]
+    position = 0
+    for label in np.unique(labels):
+        for index in rng.permutation(np.flatnonzero(labels == label)):
+            folds[position % k].append(int(index))
+            position += 1
+    return [sorted(fold) for fold in folds]
+
+
+def train_fold(fold, train_indices, val_indices, shards_dir, config):
+    """Train and evaluate one fold (runs in a worker process)
+
+    Early stopping watches a stratified slice of the fold's training
+    images, never the held-out fold, so the fold's score stays unbiased.
+    """
+    start = time.perf_counter()
+    # Thread pool sizes in the config are applied before the first op runs
+    apply_runtime_config(config)
+    reader = ShardReader(shards_dir)
+    fit_indices, stop_indices = train_indices, []
+    if config["early_stopping_patience"]:
+        shuffled = np.random.default_rng(fold).permutation(train_indices).tolist()
+        (fit_indices, _), (stop_indices, _) = split_files(
+            shuffled, reader.labels[shuffled].tolist(), EARLY_STOPPING_SPLIT)
+    train_ds = shard_dataset(reader, sorted(fit_indices), config["batch_size"], training=True, seed=fold)
+    val_ds = shard_dataset(reader, val_indices, config["batch_size"], training=False)
+
+    model = compile_model(create_model(head=config["head"], dropout=config["dropout"]),
+                          learning_rate=config["learning_rate"],
+                          jit_compile=config["xla"])
+    callbacks, stop_ds = [], None
+    if stop_indices:
+        stop_ds = shard_dataset(reader, sorted(stop_indices), config["batch_size"], training=False)
+        callbacks.append(tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=config["early_stopping_patience"],
+            restore_best_weights=True
+        ))
+    history = model.fit(train_ds, validation_data=stop_ds, epochs=config["epochs"],
+                        callbacks=callbacks, verbose=0)
+
+    val_loss, val_accuracy = model.evaluate(val_ds, verbose=0)
+    predicted = model.predict(val_ds, verbose=0)[:, 0] >= 0.5
+    positives = reader.labels[np.asarray(val_indices)] >= 0.5
+    return {
+        "fold": fold,
+        "train_images": len(fit_indices),
+        "early_stopping_images": len(stop_indices),
+        "val_images": len(val_indices),
+        "epochs": len(history.history["loss"]),
+        "val_loss": float(val_loss),
+        "val_accuracy": float(val_accuracy),
+        "sensitivity": float((predicted & positives).sum() / max(positives.sum(), 1)),
+        "specificity": float((~predicted & ~positives).sum() / max((~positives).sum(), 1)),
+        "seconds": time.perf_counter() - start
+    }
+
+
+def cross_validate(dataset_path, k=FOLDS, config=None, shards_dir=SHARDS_DIR, workers=None,
+                   seed=0, report_file=REPORT_FILE, **overrides):
+    """Train k folds in parallel processes and report the mean and spread of each metric
+
+    Images are decoded once into the shard cache and every fold process
+    memory-maps the same files. The cores are split evenly between the
+    processes so they do not oversubscribe the CPU.
+    """
+    config = load_config(config, **overrides)
+    build_shards(dataset_path, shards_dir)
+    labels = ShardReader(shards_dir).labels
+    folds = stratified_folds(labels, k, seed)
+
+    workers, threads, cores = split_cores(k, workers)
+    config = worker_config(config, threads)
+    print(f"{k}-fold cross-validation of {len(labels)} images: "
+          f"{workers} processes x {threads} threads on {cores} cores")
+
+    start = time.perf_counter()
+    results = []
+    # TensorFlow is not fork-safe, so workers are spawned
+    context = multiprocessing.get_context("spawn")
+    with child_thread_limit(threads), ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = []
+        for fold, val_indices in enumerate(folds):
+            train_indices = sorted(i for other, indices in enumerate(folds) if other != fold for i in indices)
+            futures.append(pool.submit(train_fold, fold, train_indices, val_indices, shards_dir, config))
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"Fold {result['fold'] + 1}/{k}: accuracy {result['val_accuracy']:.3f}, "
+                  f"loss {result['val_loss']:.4f} ({result['epochs']} epochs, {result['seconds']:.0f}s)")
+    results.sort(key=lambda r: r["fold"])
+
+    summary = {metric: {"mean": float(np.mean([r[metric] for r in results])),
+                        "std": float(np.std([r[metric] for r in results]))}
+               for metric in METRICS}
+    report = {
+        "dataset": dataset_path,
+        "folds": k,
+        "seed": seed,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "config": config,
+        "results": results,
+        "summary": summary,
+        "seconds": time.perf_counter() - start
+    }
+    if report_file:
+        with open(report_file, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    print(f"{'Metric':14s}{'Mean':>10s}{'Std':>10s}")
+    for metric, values in summary.items():
+        print(f"{metric:14s}{values['mean']:>10.4f}{values['std']:>10.4f}")
+    print(f"Finished in {report['seconds']:.0f}s" + (f", report written to {report_file}" if report_file else ""))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stratified k-fold cross-validation of the CNN")
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--config", help="JSON file with training settings")
+    parser.add_argument("--epochs", type=int)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--learning-rate", type=float)
+    parser.add_argument("--head", choices=HEADS)
+    parser.add_argument("--patience", type=int, help="Early stopping patience in epochs (0 disables)")
+    parser.add_argument("--shards-dir", default=SHARDS_DIR, help="Decoded image cache shared by the folds")
+    parser.add_argument("--workers", type=int, help="Parallel fold processes (default: half the cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    cross_validate(args.dataset_path, args.folds, args.config, args.shards_dir, args.workers,
+                   args.seed, args.report, epochs=args.epochs, batch_size=args.batch_size,
+                   learning_rate=args.learning_rate, head=args.head,
+                   early_stopping_patience=args.patience)
@@ -0,0 +1,265 @@
+# data_pipeline.py
+import argparse
+import glob
+import hashlib
+import math
+import os
+import random
+import time
+
+import tensorflow as tf
+
+AUTOTUNE = tf.data.AUTOTUNE
+IMAGE_SIZE = (224, 224)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# The positive class gets label 1 so the sigmoid output is the Monkeypox probability
+POSITIVE_CLASS = "Monkeypox"
+
+# Augmentation matching the old ImageDataGenerator settings
+SHEAR_RANGE = 0.2  # degrees, as interpreted by ImageDataGenerator
+ZOOM_RANGE = 0.2
+
+
+def list_dataset_files(dataset_path, index_path=None):
+    """Return (paths, labels) for every readable image in the class folders of dataset_path
+
+    The list comes from the dataset index (dataset_index.py), which leaves
+    out unreadable images and only decodes files added or changed since
+    the last call.
+    """
+    from dataset_index import indexed_files
+
+    return indexed_files(dataset_path, index_path=index_path)
+
+
+def walk_dataset(dataset_path):
+    """Return (paths, labels) for every image file in the class folders, in a stable order"""
+    class_names = sorted(
+        name for name in os.listdir(dataset_path)
+        if os.path.isdir(os.path.join(dataset_path, name))
+    )
+    if POSITIVE_CLASS not in class_names:
+        raise ValueError(f"'{dataset_path}' must contain a '{POSITIVE_CLASS}' folder")
+
+    paths, labels = [], []
+    for class_name in class_names:
+        class_dir = os.path.join(dataset_path, class_name)
+        label = 1.0 if class_name == POSITIVE_CLASS else 0.0
+        for root, dirs, files in os.walk(class_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+                    labels.append(label)
+    return paths, labels
+
+
+def split_files(paths, labels, validation_split=0.2):
+    """Split per class the way flow_from_directory does: the first part of each class validates
+
+    paths can be any per-sample items, e.g. indices into a shard set.
+    """
+    train, validation = ([], []), ([], [])
+    for label in sorted(set(labels)):
+        class_paths = [p for p, l in zip(paths, labels) if l == label]
+        cut = int(validation_split * len(class_paths))
+        validation[0].extend(class_paths[:cut])
+        validation[1].extend([label] * cut)
+        train[0].extend(class_paths[cut:])
+        train[1].extend([label] * (len(class_paths) - cut))
+    return train, validation
+
+
+def read_image(path):
+    """Read and decode one image at full size to a (height, width, 3) uint8 tensor"""
+    return tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+
+
+def decode_image(path, label):
+    """Read, decode and resize one image to a (224, 224, 3) uint8 tensor"""
+    image = tf.image.resize(read_image(path), IMAGE_SIZE)
+    image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    return image, label
+
+
+def cache_prefix(cache_dir, subset, paths, labels, seed=None):
+    """Path prefix of the on-disk cache for one file list
+
+    tf.data reuses an existing cache file, so its name covers everything
+    that changes the cached tensors: the files and their labels, sizes and
+    modification times (and with them the split), the seed that orders
+    them, and the image size.
+    """
+    digest = hashlib.sha256(f"{IMAGE_SIZE}\0{seed}\n".encode("utf-8"))
+    for path, label in sorted(zip(paths, labels)):
+        stat = os.stat(path)
+        digest.update(f"{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return os.path.join(cache_dir, f"{subset}-{digest.hexdigest()[:16]}")
+
+
+def _prepare_cache(prefix):
+    """Clear what earlier runs left next to the cache at prefix
+
+    A run that stopped while writing leaves its lockfile behind, and
+    tf.data refuses to write the cache again while it exists. Caches of
+    other file lists of the same subset are removed unless a run is
+    writing them.
+    """
+    cache_dir, name = os.path.split(prefix)
+    os.makedirs(cache_dir, exist_ok=True)
+    if not os.path.exists(prefix + ".index"):
+        for lockfile in glob.glob(glob.escape(prefix) + "*.lockfile"):
+            os.remove(lockfile)
+    subset = name.rsplit("-", 1)[0]
+    stale = {}
+    for path in glob.glob(os.path.join(glob.escape(cache_dir), f"{subset}-*")):
+        other = os.path.basename(path)[len(subset) + 1:][:16]
+        if os.path.join(cache_dir, f"{subset}-{other}") != prefix:
+            stale.setdefault(other, []).append(path)
+    for files in stale.values():
+        if not any(path.endswith(".lockfile") for path in files):
+            for path in files:
+                os.remove(path)
+
+
+def augment_batch(images, labels):
+    """Random shear, zoom and horizontal flip applied to a whole batch in one op"""
+    images = tf.cast(images, tf.float32)
+    batch = tf.shape(images)[0]
+    height = tf.cast(tf.shape(images)[1], tf.float32)
+    width = tf.cast(tf.shape(images)[2], tf.float32)
+
+    shear = tf.random.uniform([batch], -SHEAR_RANGE, SHEAR_RANGE) * (math.pi / 180)
+    zoom_x = tf.random.uniform([batch], 1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+    zoom_y = tf.random.uniform([batch], 1 - ZOOM_RANGE, 1 + ZOOM_RANGE)
+
+    # Output pixel (x, y) samples the input at A @ ((x, y) - center) + center
+    a0 = zoom_x
+    a1 = -tf.sin(shear) * zoom_y
+    b0 = tf.zeros([batch])
+    b1 = tf.cos(shear) * zoom_y
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    a2 = cx - (a0 * cx + a1 * cy)
+    b2 = cy - (b0 * cx + b1 * cy)
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, tf.zeros([batch]), tf.zeros([batch])], axis=1)
+
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=tf.shape(images)[1:3],
+        fill_value=0.0, interpolation="BILINEAR", fill_mode="NEAREST"
+    )
+
+    flip = tf.random.uniform([batch]) < 0.5
+    images = tf.where(flip[:, None, None, None], tf.image.flip_left_right(images), images)
+    return images, labels
+
+
+def rescale_batch(images, labels):
+    return tf.cast(images, tf.float32) / 255.0, labels
+
+
+def make_dataset(paths, labels, batch_size=32, training=False, cache=None,
+                 augment=True, shuffle_buffer=1000, seed=None):
+    """Build a batched, prefetched dataset from file paths
+
+    cache is None (decode every epoch), "memory", or a directory for an
+    on-disk cache of the decoded 224x224 uint8 tensors, named after the
+    file list (see cache_prefix).
+    """
+    if cache and cache != "memory":
+        prefix = cache_prefix(cache, "training" if training else "validation", paths, labels,
+                              seed if training else None)
+        _prepare_cache(prefix)
+    if training:
+        # The file list is sorted by class and the shuffle buffer below only
+        # mixes nearby samples, so permute the whole list once up front
+        pairs = list(zip(paths, labels))
+        random.Random(seed).shuffle(pairs)
+        paths, labels = [p for p, _ in pairs], [l for _, l in pairs]
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, tf.constant(labels, tf.float32)))
+    ds = ds.map(decode_image, num_parallel_calls=AUTOTUNE, deterministic=not training)
+
+    if cache == "memory":
+        ds = ds.cache()
+    elif cache:
+        ds = ds.cache(prefix)
+
+    if training:
+        ds = ds.shuffle(min(len(paths), shuffle_buffer), seed=seed, reshuffle_each_iteration=True)
+    return finish_batches(ds.batch(batch_size), training, augment)
+
+
+def finish_batches(ds, training=False, augment=True):
+    """Augment (training only), rescale to [0, 1] and prefetch a batched uint8 dataset"""
+    if training and augment:
+        ds = ds.map(augment_batch, num_parallel_calls=AUTOTUNE)
+    ds = ds.map(rescale_batch, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def build_datasets(dataset_path, batch_size=32, validation_split=0.2, cache=None, seed=None):
+    """Return (train_ds, val_ds) for a dataset folder with Monkeypox and Normal subfolders"""
+    paths, labels = list_dataset_files(dataset_path)
+    (train_paths, train_labels), (val_paths, val_labels) = split_files(paths, labels, validation_split)
+    train_ds = make_dataset(train_paths, train_labels, batch_size, training=True, cache=cache, seed=seed)
+    val_ds = make_dataset(val_paths, val_labels, batch_size, training=False, cache=cache)
+    return train_ds, val_ds
+
+
+def legacy_generator(dataset_path, batch_size=32, validation_split=0.2):
+    """The ImageDataGenerator pipeline train_model used before, kept for benchmarking"""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    datagen = ImageDataGenerator(
+        rescale=1. / 255,
+        shear_range=0.2,
+        zoom_range=0.2,
+        horizontal_flip=True,
+        validation_split=validation_split
+    )
+    return datagen.flow_from_directory(
+        dataset_path,
+        target_size=IMAGE_SIZE,
+        batch_size=batch_size,
+        class_mode='binary',
+        subset='training'
+    )
+
+
+def benchmark_input_pipeline(dataset_path, batch_size=32, epochs=3, cache="memory"):
+    """Compare per-epoch wall time of the old generator and the tf.data pipeline"""
+    results = {"generator": [], "tf.data": []}
+
+    generator = legacy_generator(dataset_path, batch_size)
+    steps = max(generator.samples // batch_size, 1)
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for _ in range(steps):
+            next(generator)
+        results["generator"].append(time.perf_counter() - start)
+
+    train_ds, _ = build_datasets(dataset_path, batch_size, cache=cache)
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for _ in train_ds:
+            pass
+        results["tf.data"].append(time.perf_counter() - start)
+
+    print(f"Input pipeline epoch wall time ({steps} steps of {batch_size} images)")
+    for name, times in results.items():
+        print(f"  {name:10s} " + "  ".join(f"{t:7.2f}s" for t in times))
+    speedup = sum(results["generator"]) / max(sum(results["tf.data"]), 1e-9)
+    print(f"  tf.data is {speedup:.1f}x faster over {epochs} epochs")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the training input pipeline")
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--cache", default="memory", help='"memory", a directory, or "none"')
+    args = parser.parse_args()
+    benchmark_input_pipeline(args.dataset_path, args.batch_size, args.epochs,
+                             None if args.cache == "none" else args.cache)
@@ -0,0 +1,326 @@
+# dataset_index.py
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# One index per dataset folder, outside it so read-only or shared mounts still work
+INDEX_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                         "monkeypox", "dataset_index")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+HASH_SIZE = 8                     # dHash of HASH_SIZE x HASH_SIZE bits
+NEAR_DUPLICATE_DISTANCE = 6       # differing dHash bits at which two images count as the same photo
+VALIDATION_SPLIT = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,          -- relative to the dataset folder, "/" separated
+    label REAL NOT NULL,            -- 1.0 for Monkeypox
+    size INTEGER NOT NULL,          -- bytes
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    dhash TEXT,                     -- 64-bit difference hash as 16 hex digits
+    status TEXT NOT NULL,           -- "ok" or "quarantined"
+    error TEXT,                     -- why the image could not be read
+    quarantined_to TEXT,            -- where a quarantined file was moved, if it was
+    indexed TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS near_duplicates (
+    path_a TEXT NOT NULL,
+    path_b TEXT NOT NULL,
+    distance INTEGER NOT NULL,      -- differing dHash bits
+    cross_split INTEGER NOT NULL,   -- 1 if one image trains and the other validates
+    PRIMARY KEY (path_a, path_b)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Set bits in every byte value, for counting differing hash bits
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def default_index_path(dataset_path):
+    """Where the index of dataset_path lives unless --index says otherwise"""
+    dataset_path = os.path.abspath(dataset_path)
+    digest = hashlib.sha256(dataset_path.encode("utf-8")).hexdigest()[:16]
+    name = os.path.basename(dataset_path.rstrip(os.sep)) or "dataset"
+    return os.path.join(INDEX_DIR, f"{name}-{digest}.db")
+
+
+def inspect_image(path):
+    """Fully decode an image and return (width, height, dhash); raises if the file is unreadable
+
+    Decodes with data_pipeline.read_image, the decoder training uses, so an
+    image that passes here cannot fail mid-epoch. The dHash compares
+    neighbouring pixels of a 9x8 grayscale thumbnail, so it survives
+    resizing, recompression and small colour changes.
+    """
+    import tensorflow as tf
+
+    from data_pipeline import read_image
+
+    image = read_image(path)
+    height, width = int(image.shape[0]), int(image.shape[1])
+    thumbnail = tf.image.resize(tf.image.rgb_to_grayscale(image), (HASH_SIZE, HASH_SIZE + 1), method="area")
+    pixels = thumbnail.numpy()[:, :, 0]
+    bits = np.packbits((pixels[:, 1:] > pixels[:, :-1]).ravel())
+    return width, height, bits.tobytes().hex()
+
+
+def _inspect(path):
+    try:
+        return inspect_image(path) + (None,)
+    except Exception as e:
+        return None, None, None, f"{type(e).__name__}: {e}"
+
+
+def hamming_pairs(hashes, max_distance=NEAR_DUPLICATE_DISTANCE, block=256):
+    """Yield (i, j, distance) for i < j whose hex hashes differ in at most max_distance bits"""
+    values = np.array([int(h, 16) for h in hashes], dtype=np.uint64)
+    for start in range(0, len(values), block):
+        rows = values[start:start + block]
+        differing = (rows[:, None] ^ values[None, :]).view(np.uint8).reshape(len(rows), len(values), 8)
+        distances = _POPCOUNT[differing].sum(axis=2)
+        for i, j in zip(*np.nonzero(distances <= max_distance)):
+            if start + i < j:
+                yield int(start + i), int(j), int(distances[i, j])
+
+
+class DatasetIndex:
+    """Index of a dataset folder: size, mtime, dimensions and dHash of every image
+
+    update() walks the class folders once and decodes only new or changed
+    files, in parallel. Unreadable images are quarantined: kept out of
+    files() and optionally moved out of the dataset.
+    """
+
+    def __init__(self, dataset_path, index_path=None):
+        self.dataset_path = dataset_path
+        self.index_path = index_path or default_index_path(dataset_path)
+        if self.index_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.index_path)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self.paths, self.labels = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.dataset_path).replace(os.sep, "/")
+
+    def update(self, workers=None, quarantine_dir=None):
+        """Bring the index up to date with the folder and return counts of what changed
+
+        With quarantine_dir, unreadable files are also moved there (keeping
+        their class folder) so other tools stop tripping over them.
+        """
+        from data_pipeline import walk_dataset
+
+        start = time.perf_counter()
+        self.paths, self.labels = walk_dataset(self.dataset_path)
+        walked = len(self.paths)
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                 self._conn.execute("SELECT path, size, mtime_ns FROM images WHERE quarantined_to IS NULL")}
+
+        changed = []
+        for path, label in zip(self.paths, self.labels):
+            stat = os.stat(path)
+            if known.pop(self._relative(path), None) != (stat.st_size, stat.st_mtime_ns):
+                changed.append((path, label, stat.st_size, stat.st_mtime_ns))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            inspected = list(executor.map(_inspect, [path for path, _, _, _ in changed]))
+
+        now = datetime.now().strftime(TIMESTAMP_FORMAT)
+        rows = [(self._relative(path), label, size, mtime_ns, width, height, dhash,
+                 "quarantined" if error else "ok", error, None, now)
+                for (path, label, size, mtime_ns), (width, height, dhash, error) in zip(changed, inspected)]
+
+        moved = []
+        if quarantine_dir:
+            # Includes images quarantined by earlier runs that did not move them
+            unreadable = {row[0] for row in rows if row[7] == "quarantined"}
+            unreadable.update(path for path, in self._conn.execute(
+                "SELECT path FROM images WHERE status = 'quarantined' AND quarantined_to IS NULL"))
+            for path in self.paths:
+                if self._relative(path) in unreadable:
+                    moved.append((path, os.path.join(quarantine_dir, self._relative(path))))
+            for source, target in moved:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(source, target)
+        if moved:
+            moved_paths = {source for source, _ in moved}
+            kept = [(p, l) for p, l in zip(self.paths, self.labels) if p not in moved_paths]
+            self.paths, self.labels = [p for p, _ in kept], [l for _, l in kept]
+
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in known])
+            self._conn.executemany("UPDATE images SET quarantined_to = ? WHERE path = ?",
+                                   [(target, self._relative(source)) for source, target in moved])
+            if rows or known:
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('duplicates_current', '0')")
+
+        summary = {
+            "files": len(self.paths),
+            "indexed": len(rows),
+            "unchanged": walked - len(rows),
+            "removed": len(known),
+            "quarantined": sum(1 for row in rows if row[7] == "quarantined"),
+            "moved": len(moved),
+            "seconds": time.perf_counter() - start
+        }
+        return summary
+
+    def _statuses(self):
+        return dict(self._conn.execute("SELECT path, status FROM images"))
+
+    def files(self):
+        """(paths, labels) of the readable images in the order the folder was walked"""
+        if not self.paths:
+            self.update()
+        statuses = self._statuses()
+        kept = [(path, label) for path, label in zip(self.paths, self.labels)
+                if statuses.get(self._relative(path)) == "ok"]
+        return [path for path, _ in kept], [label for _, label in kept]
+
+    def quarantined(self):
+        """(path, error, moved to) of every unreadable image"""
+        return self._conn.execute(
+            "SELECT path, error, quarantined_to FROM images WHERE status = 'quarantined' ORDER BY path"
+        ).fetchall()
+
+    def duplicates_current(self, max_distance=NEAR_DUPLICATE_DISTANCE, validation_split=VALIDATION_SPLIT):
+        """Whether the cached pairs match these settings and the files last indexed"""
+        current = self._conn.execute("SELECT value FROM meta WHERE key = 'duplicates_current'").fetchone()
+        return current == (f"{max_distance}/{validation_split}",)
+
+    def near_duplicates(self, max_distance=NEAR_DUPLICATE_DISTANCE, validation_split=VALIDATION_SPLIT,
+                        refresh=True):
+        """Pairs of readable images that look like the same photo, as dicts
+
+        cross_split marks pairs split between training and validation by
+        split_files; those make the validation accuracy optimistic. The
+        pairs are cached in the index until the files change; refresh=False
+        returns the cached pairs even if they are out of date.
+        """
+        if refresh and not self.duplicates_current(max_distance, validation_split):
+            self._find_near_duplicates(max_distance, validation_split)
+        labels = dict(self._conn.execute("SELECT path, label FROM images"))
+        rows = self._conn.execute(
+            "SELECT path_a, path_b, distance, cross_split FROM near_duplicates "
+            "ORDER BY cross_split DESC, distance, path_a"
+        ).fetchall()
+        return [{"path_a": a, "path_b": b, "distance": distance, "cross_split": bool(cross),
+                 "same_label": labels.get(a) == labels.get(b)} for a, b, distance, cross in rows]
+
+    def _find_near_duplicates(self, max_distance, validation_split):
+        from data_pipeline import split_files
+
+        paths, labels = self.files()
+        relative = [self._relative(path) for path in paths]
+        hashes = dict(self._conn.execute("SELECT path, dhash FROM images WHERE status = 'ok'"))
+        _, (validation, _) = split_files(relative, labels, validation_split)
+        validation = set(validation)
+
+        pairs = []
+        for i, j, distance in hamming_pairs([hashes[path] for path in relative], max_distance):
+            a, b = relative[i], relative[j]
+            pairs.append((a, b, distance, int((a in validation) != (b in validation))))
+        with self._conn:
+            self._conn.execute("DELETE FROM near_duplicates")
+            self._conn.executemany("INSERT INTO near_duplicates VALUES (?, ?, ?, ?)", pairs)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('duplicates_current', ?)",
+                               (f"{max_distance}/{validation_split}",))
+
+    def close(self):
+        self._conn.close()
+
+
+def indexed_files(dataset_path, workers=None, index_path=None):
+    """(paths, labels) of the readable images, updating the index first
+
+    This is what data_pipeline.list_dataset_files returns. Newly found
+    unreadable images and near-duplicates across the split are reported.
+    If the index cannot be written, every image is checked in memory.
+    """
+    try:
+        index = DatasetIndex(dataset_path, index_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: cannot write the dataset index ({e}), checking every image instead")
+        index = DatasetIndex(dataset_path, ":memory:")
+    with index:
+        summary = index.update(workers)
+        if summary["indexed"]:
+            print(f"Indexed {summary['indexed']} new or changed images in {summary['seconds']:.1f}s")
+        if summary["quarantined"]:
+            print(f"Warning: {summary['quarantined']} unreadable images were left out "
+                  f"(python dataset_index.py {dataset_path} --show-quarantined)")
+        if summary["indexed"] or summary["removed"]:
+            leaks = sum(pair["cross_split"] for pair in index.near_duplicates())
+            if leaks:
+                print(f"Warning: {leaks} near-duplicate pairs are split between training and validation "
+                      f"(python dataset_index.py {dataset_path} --show-duplicates)")
+        return index.files()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the dataset, quarantine unreadable images and find duplicates")
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--index", help="Index file (default: one per dataset under ~/.cache/monkeypox)")
+    parser.add_argument("--workers", type=int, help="Parallel image decoders")
+    parser.add_argument("--quarantine-dir", help="Move unreadable images here (default: only leave them out)")
+    parser.add_argument("--max-distance", type=int, default=NEAR_DUPLICATE_DISTANCE,
+                        help="Differing hash bits at which images count as near-duplicates")
+    parser.add_argument("--show-quarantined", action="store_true",
+                        help="List what the index holds without updating it")
+    parser.add_argument("--show-duplicates", action="store_true",
+                        help="List every pair the index holds without updating it")
+    parser.add_argument("--rebuild", action="store_true", help="Re-read every image")
+    args = parser.parse_args()
+
+    index_path = args.index or default_index_path(args.dataset_path)
+    if args.rebuild and os.path.exists(index_path):
+        os.remove(index_path)
+
+    showing = args.show_quarantined or args.show_duplicates
+    with DatasetIndex(args.dataset_path, index_path) as dataset_index:
+        if not showing:
+            result = dataset_index.update(args.workers, args.quarantine_dir)
+            print(f"{result['files']} images: {result['indexed']} indexed, {result['unchanged']} unchanged, "
+                  f"{result['removed']} removed, {result['quarantined']} quarantined "
+                  f"({result['seconds']:.1f}s)")
+
+        quarantined = dataset_index.quarantined()
+        if args.show_quarantined:
+            for image_path, error, moved_to in quarantined:
+                print(f"  {image_path}: {error}" + (f" (moved to {moved_to})" if moved_to else ""))
+        elif quarantined:
+            print(f"{len(quarantined)} unreadable images in total (--show-quarantined to list them)")
+
+        duplicates = dataset_index.near_duplicates(args.max_distance, refresh=not showing)
+        leaks = [pair for pair in duplicates if pair["cross_split"]]
+        print(f"{len(duplicates)} near-duplicate pairs, {len(leaks)} split between training and validation")
+        if showing and not dataset_index.duplicates_current(args.max_distance):
+            print(f"The pairs are out of date, run python dataset_index.py {args.dataset_path} to refresh them")
+        if args.show_duplicates:
+            for pair in duplicates:
+                flags = [flag for flag, on in (("cross-split", pair["cross_split"]),
+                                               ("label conflict", not pair["same_label"])) if on]
+                print(f"  {pair['distance']:2d}  {pair['path_a']}  {pair['path_b']}"
+                      + (f"  [{', '.join(flags)}]" if flags else ""))
@@ -0,0 +1,175 @@
+# dataset_shards.py
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import (AUTOTUNE, IMAGE_SIZE, decode_image, finish_batches,
+                           list_dataset_files, split_files)
+
+SHARDS_DIR = "data/shards"
+SHARD_SIZE = 1024
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(dataset_path, paths, labels, workers=None):
+    """Hash the content, name and label of every source image
+
+    Reading the raw bytes is far cheaper than decoding them, so this is
+    checked on every run to catch added, removed or edited images.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(_file_digest, paths))
+
+    fingerprint = hashlib.sha256()
+    fingerprint.update(f"v{FORMAT_VERSION} {IMAGE_SIZE}".encode())
+    for path, label, digest in zip(paths, labels, digests):
+        relative = os.path.relpath(path, dataset_path).replace(os.sep, "/")
+        fingerprint.update(f"{relative}\0{label}\0{digest}\n".encode())
+    return fingerprint.hexdigest()
+
+
+def load_manifest(shards_dir=SHARDS_DIR):
+    """Return the shard manifest, or None if there is no shard set"""
+    manifest_path = os.path.join(shards_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def build_shards(dataset_path, shards_dir=SHARDS_DIR, shard_size=SHARD_SIZE, force=False):
+    """Decode the dataset once into uint8 .npy shards, unless up-to-date shards exist
+
+    Returns the manifest describing the shard set.
+    """
+    paths, labels = list_dataset_files(dataset_path)
+    fingerprint = dataset_fingerprint(dataset_path, paths, labels)
+
+    manifest = load_manifest(shards_dir)
+    if not force and manifest and manifest["fingerprint"] == fingerprint:
+        return manifest
+
+    print(f"Preprocessing {len(paths)} images into {shards_dir}...")
+    start = time.perf_counter()
+    os.makedirs(shards_dir, exist_ok=True)
+
+    # Remove the manifest first so an interrupted rebuild is never mistaken for a valid one
+    manifest_path = os.path.join(shards_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    for name in os.listdir(shards_dir):
+        if name.startswith("images-") and name.endswith(".npy"):
+            os.remove(os.path.join(shards_dir, name))
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, tf.constant(labels, tf.float32)))
+    ds = ds.map(decode_image, num_parallel_calls=AUTOTUNE).batch(shard_size).prefetch(2)
+
+    shards = []
+    for number, (images, _) in enumerate(ds.as_numpy_iterator()):
+        name = f"images-{number:05d}.npy"
+        np.save(os.path.join(shards_dir, name), images)
+        shards.append({"file": name, "count": len(images)})
+
+    np.save(os.path.join(shards_dir, "labels.npy"), np.asarray(labels, dtype=np.float32))
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "fingerprint": fingerprint,
+        "image_size": list(IMAGE_SIZE),
+        "count": len(paths),
+        "shards": shards,
+        "paths": [os.path.relpath(p, dataset_path).replace(os.sep, "/") for p in paths]
+    }
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file)
+
+    print(f"Wrote {len(shards)} shards in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+class ShardReader:
+    """Random access to a shard set through memory-mapped .npy files"""
+
+    def __init__(self, shards_dir=SHARDS_DIR):
+        self.shards_dir = shards_dir
+        self.manifest = load_manifest(shards_dir)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No shard manifest in '{shards_dir}'")
+
+        self.images = [np.load(os.path.join(shards_dir, shard["file"]), mmap_mode='r')
+                       for shard in self.manifest["shards"]]
+        self.labels = np.load(os.path.join(shards_dir, "labels.npy"))
+        self.offsets = np.cumsum([0] + [shard["count"] for shard in self.manifest["shards"]])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def gather(self, indices):
+        """Return (images, labels) for the given global indices as in-memory arrays"""
+        indices = np.asarray(indices)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+        images = np.empty((len(indices),) + tuple(self.manifest["image_size"]) + (3,), dtype=np.uint8)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            images[mask] = self.images[shard_id][indices[mask] - self.offsets[shard_id]]
+        return images, self.labels[indices]
+
+
+def shard_dataset(reader, indices, batch_size=32, training=False, augment=True, seed=None):
+    """Stream batches for the given sample indices from a ShardReader"""
+    indices = np.asarray(indices, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        order = rng.permutation(indices) if training else indices
+        for start in range(0, len(order), batch_size):
+            # Sorted reads keep access to the memory-mapped files sequential
+            yield reader.gather(np.sort(order[start:start + batch_size]))
+
+    height, width = reader.manifest["image_size"]
+    ds = tf.data.Dataset.from_generator(
+        batches,
+        output_signature=(
+            tf.TensorSpec((None, height, width, 3), tf.uint8),
+            tf.TensorSpec((None,), tf.float32)
+        )
+    )
+    return finish_batches(ds, training, augment)
+
+
+def build_shard_datasets(dataset_path, shards_dir=SHARDS_DIR, batch_size=32,
+                         validation_split=0.2, seed=None):
+    """Return (train_ds, val_ds) streamed from shards, rebuilding them if the images changed"""
+    build_shards(dataset_path, shards_dir)
+    reader = ShardReader(shards_dir)
+    indices = list(range(len(reader)))
+    (train_idx, _), (val_idx, _) = split_files(indices, reader.labels.tolist(), validation_split)
+    train_ds = shard_dataset(reader, train_idx, batch_size, training=True, seed=seed)
+    val_ds = shard_dataset(reader, val_idx, batch_size, training=False)
+    return train_ds, val_ds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess the dataset into uint8 .npy shards")
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--out", default=SHARDS_DIR, help="Shard output directory")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--force", action="store_true", help="Rebuild even if shards are current")
+    args = parser.parse_args()
+    result = build_shards(args.dataset_path, args.out, args.shard_size, args.force)
+    print(f"{result['count']} images in {len(result['shards'])} shards ({args.out})")
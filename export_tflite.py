@@ -0,0 +1,132 @@
+# export_tflite.py
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import list_dataset_files, split_files
+from inference import InferenceEngine, load_image_array
+
+MODEL_PATH = "monkeypox_model.h5"
+
+# float   - plain float32 TFLite model
+# dynamic - int8 weights, float activations (no calibration needed)
+# int8    - full integer model calibrated on training images
+VARIANTS = ("float", "dynamic", "int8")
+
+
+def representative_images(dataset_path, count=100, validation_split=0.2):
+    """Pick evenly spaced training images (never validation ones) for calibration"""
+    paths, labels = list_dataset_files(dataset_path)
+    (train_paths, _), _ = split_files(paths, labels, validation_split)
+    step = max(len(train_paths) // count, 1)
+    return train_paths[::step][:count]
+
+
+def convert(model, variant, calibration_paths=None, calibration_images=None):
+    """Convert a Keras model into TFLite flatbuffer bytes
+
+    The int8 variant is calibrated on calibration_paths, or on
+    calibration_images ((224, 224, 3) uint8 arrays) when those are given.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if variant in ("dynamic", "int8"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if variant == "int8":
+        if not calibration_paths and calibration_images is None:
+            raise ValueError("The int8 variant needs calibration images")
+
+        def representative_dataset():
+            images = calibration_images
+            if images is None:
+                images = (load_image_array(path) for path in calibration_paths)
+            for image in images:
+                yield [image[np.newaxis].astype(np.float32) / 255.0]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    return converter.convert()
+
+
+def export_tflite(model_path=MODEL_PATH, dataset_path="data/dataset", out_dir=".",
+                  variants=VARIANTS, calibration_count=100):
+    """Write one .tflite file per variant into out_dir and return their paths"""
+    model = tf.keras.models.load_model(model_path, compile=False)
+    calibration_paths = representative_images(dataset_path, calibration_count) if "int8" in variants else None
+
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.splitext(os.path.basename(model_path))[0]
+    exported = {}
+    for variant in variants:
+        path = os.path.join(out_dir, f"{base}_{variant}.tflite")
+        with open(path, 'wb') as file:
+            file.write(convert(model, variant, calibration_paths))
+        exported[variant] = path
+        print(f"Wrote {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB)")
+    return exported
+
+
+def evaluate_accuracy(model_paths, dataset_path="data/dataset", validation_split=0.2, batch_size=32):
+    """Compare accuracy and probability drift of several models on the validation split
+
+    model_paths maps a display name to a model file. The first entry is the
+    reference that the others are compared against.
+    """
+    paths, labels = list_dataset_files(dataset_path)
+    _, (val_paths, val_labels) = split_files(paths, labels, validation_split)
+    val_labels = np.asarray(val_labels)
+
+    probabilities = {}
+    for name, path in model_paths.items():
+        engine = InferenceEngine(path)
+        results = []
+        for start in range(0, len(val_paths), batch_size):
+            batch = np.stack([load_image_array(p) for p in val_paths[start:start + batch_size]])
+            results.extend(engine.predict_batch(batch))
+        probabilities[name] = np.asarray(results)
+
+    reference = probabilities[next(iter(model_paths))]
+    reference_accuracy = float(np.mean((reference >= 0.5) == (val_labels >= 0.5)))
+    report = {}
+    for name, probs in probabilities.items():
+        accuracy = float(np.mean((probs >= 0.5) == (val_labels >= 0.5)))
+        report[name] = {
+            "accuracy": accuracy,
+            "accuracy_delta": accuracy - reference_accuracy,
+            "mean_abs_probability_delta": float(np.mean(np.abs(probs - reference))),
+            "size_mb": _model_size(model_paths[name]) / (1024 * 1024)
+        }
+
+    print(f"{'Model':10s}{'Size MB':>10s}{'Accuracy':>10s}{'Delta':>9s}{'Prob drift':>12s}  ({len(val_paths)} images)")
+    for name, r in report.items():
+        print(f"{name:10s}{r['size_mb']:>10.1f}{r['accuracy']:>10.3f}{r['accuracy_delta']:>+9.3f}"
+              f"{r['mean_abs_probability_delta']:>12.4f}")
+    return report
+
+
+def _model_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the trained model to TFLite")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--dataset", default="data/dataset", help="Used for calibration and evaluation")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument("--calibration-images", type=int, default=100)
+    parser.add_argument("--no-eval", action="store_true", help="Skip the validation accuracy comparison")
+    args = parser.parse_args()
+
+    exported = export_tflite(args.model, args.dataset, args.out_dir, args.variants, args.calibration_images)
+    if not args.no_eval:
+        evaluate_accuracy({"keras": args.model, **exported}, args.dataset)
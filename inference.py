@@ -0,0 +1,423 @@
+# inference.py
+import os
+import threading
+import time
+
+import numpy as np
+
+# Set MONKEYPOX_MODEL to use another model, e.g. monkeypox_model_int8.tflite
+MODEL_PATH = os.environ.get("MONKEYPOX_MODEL", "monkeypox_model.h5")
+IMAGE_SIZE = (224, 224)
+PREVIEW_SIZE = (400, 400)  # the GUI's image preview
+
+# Every prediction path decodes JPEGs at the draft scale for DRAFT_SIZE and
+# resizes with the same filter (see model_input), so a file gets the same
+# input in the GUI, the CLI, batch scoring and the service. DRAFT_SIZE
+# covers both the preview and the model input, so one decode serves both.
+# Bump INPUT_VERSION when this changes so cached predictions are not reused.
+DRAFT_SIZE = tuple(max(preview, model) for preview, model in zip(PREVIEW_SIZE, IMAGE_SIZE))
+INPUT_VERSION = 3
+
+# Test-time augmentation views as (zoom, shift x, shift y, horizontal flip).
+# zoom < 1 crops in like the training zoom range; shifts of +-1 move the crop
+# to the image edge. Views are used in this order, so the first N are a
+# balanced subset.
+TTA_TRANSFORMS = (
+    (1.0, 0, 0, False),
+    (1.0, 0, 0, True),
+    (0.85, 0, 0, False),
+    (0.85, 0, 0, True),
+    (0.85, -1, -1, False),
+    (0.85, 1, -1, True),
+    (0.85, -1, 1, True),
+    (0.85, 1, 1, False),
+)
+TTA_VIEWS = 8
+
+# Load states reported by the engine
+NOT_LOADED = "not loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+def preprocess_image(image, target_size=IMAGE_SIZE):
+    """Convert a path, PIL image or array into a normalized (224, 224, 3) float32 array"""
+    if isinstance(image, np.ndarray):
+        # Arrays are expected to be resized already
+        if image.dtype == np.uint8:
+            return image.astype(np.float32) / 255.0
+        return image.astype(np.float32)
+
+    if isinstance(image, (str, os.PathLike)):
+        return load_image_array(image, target_size).astype(np.float32) / 255.0
+
+    return model_input(image, target_size).astype(np.float32) / 255.0
+
+
+def open_image(source):
+    """Open an image (path or file object) to be decoded at no less than DRAFT_SIZE
+
+    JPEGs are put in draft mode so the decoder itself scales by 1/2, 1/4 or
+    1/8; a 12 megapixel photo is never expanded to full resolution. Other
+    formats decode at full size as before.
+    """
+    from PIL import Image
+
+    img = Image.open(source)
+    img.draft("RGB", DRAFT_SIZE)
+    return img
+
+
+def model_input(img, target_size=IMAGE_SIZE):
+    """The (224, 224, 3) uint8 model input for a PIL image opened with open_image
+
+    Bilinear resampling is the closest PIL filter to the tf.image.resize
+    used in training.
+    """
+    from PIL import Image
+
+    return np.asarray(img.convert("RGB").resize(target_size, Image.BILINEAR), dtype=np.uint8)
+
+
+def load_image_array(path, target_size=IMAGE_SIZE):
+    """Decode an image file (path or file object) into a resized (224, 224, 3) uint8 array"""
+    with open_image(path) as img:
+        return model_input(img, target_size)
+
+
+def load_preview(path, preview_size=PREVIEW_SIZE, target_size=IMAGE_SIZE):
+    """Decode an image once for both a preview and the model input
+
+    Returns (preview, array, info): a PIL image that fits in preview_size,
+    the (224, 224, 3) uint8 model input, and decode statistics - original
+    and decoded size, bytes held by the decoded image and seconds taken.
+    The decode is the same as load_image_array's, so the preview is made
+    from an image at least DRAFT_SIZE large.
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        original_size = img.size
+        img.draft("RGB", DRAFT_SIZE)
+        img = img.convert("RGB")
+
+    decoded_size = img.size
+    array = model_input(img, target_size)
+    img.thumbnail(preview_size)
+    info = {
+        "original_size": original_size,
+        "decoded_size": decoded_size,
+        "decoded_bytes": decoded_size[0] * decoded_size[1] * 3,
+        "seconds": time.perf_counter() - start
+    }
+    return img, array, info
+
+
+def tta_views(image, views=TTA_VIEWS):
+    """Return a (views, 224, 224, 3) float32 batch of flipped and cropped copies of one image
+
+    Views are resampled with vectorized bilinear interpolation in numpy, so
+    TTA works with every backend, TFLite included.
+    """
+    if not 1 <= views <= len(TTA_TRANSFORMS):
+        raise ValueError(f"views must be between 1 and {len(TTA_TRANSFORMS)}")
+    image = preprocess_image(image)
+    height, width = image.shape[:2]
+    zoom, shift_x, shift_y, flip = (np.asarray(column, dtype=np.float32)
+                                    for column in zip(*TTA_TRANSFORMS[:views]))
+
+    def source_coords(size, shift):
+        # Where each output pixel samples the input, per view: shape (views, size)
+        center = (size - 1) / 2
+        out = np.arange(size, dtype=np.float32)
+        coords = center + (out - center) * zoom[:, None] + shift[:, None] * (1 - zoom[:, None]) * center
+        low = np.clip(np.floor(coords), 0, size - 1).astype(np.int64)
+        high = np.minimum(low + 1, size - 1)
+        weight = np.clip(coords - low, 0, 1).astype(np.float32)
+        return low, high, weight
+
+    x0, x1, wx = source_coords(width, shift_x)
+    y0, y1, wy = source_coords(height, shift_y)
+    flipped = flip.astype(bool)
+    x0[flipped], x1[flipped], wx[flipped] = x0[flipped, ::-1], x1[flipped, ::-1], wx[flipped, ::-1]
+
+    # Separable: interpolate between rows for all views at once, then between
+    # columns (a per-view column gather is much faster than a 4-D fancy index)
+    wy = wy[:, :, None, None]
+    rows = image[y0] * (1 - wy) + image[y1] * wy
+    left = np.stack([view[:, cols] for view, cols in zip(rows, x0)])
+    right = np.stack([view[:, cols] for view, cols in zip(rows, x1)])
+    wx = wx[:, None, :, None]
+    return left * (1 - wx) + right * wx
+
+
+class KerasBackend:
+    """Runs the saved Keras model (.h5 or SavedModel directory)"""
+
+    name = "keras"
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self):
+        import tensorflow as tf
+
+        self.model = tf.keras.models.load_model(self.model_path, compile=False)
+
+    def predict_batch(self, batch):
+        return self.model(batch, training=False).numpy()[:, 0]
+
+
+class SavedModelBackend:
+    """Runs a TensorFlow SavedModel directory through its serving signature"""
+
+    name = "savedmodel"
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self):
+        import tensorflow as tf
+
+        self.model = tf.saved_model.load(self.model_path)
+        self.signature = self.model.signatures["serving_default"]
+        self.input_name = next(iter(self.signature.structured_input_signature[1]))
+        self._constant = tf.constant
+
+    def predict_batch(self, batch):
+        outputs = self.signature(**{self.input_name: self._constant(batch, dtype="float32")})
+        return next(iter(outputs.values())).numpy()[:, 0]
+
+
+class TFLiteBackend:
+    """Runs an exported .tflite model (float, dynamic-range or int8)
+
+    Uses the small tflite_runtime package when it is installed and falls
+    back to the interpreter bundled with TensorFlow. Resizing an
+    interpreter's input reallocates all of its tensors, so batches are
+    padded to the next power of two and each of those sizes gets its own
+    interpreter, allocated once. The model file is memory-mapped, so the
+    interpreters share the weights.
+    """
+
+    name = "tflite"
+    MAX_INTERPRETERS = 8
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count()
+        self.interpreter = None
+        self._interpreters = {}  # padded batch size -> (interpreter, input details, output details)
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self._make_interpreter = lambda: Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter = self._make_interpreter()
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self._interpreters = {int(self.input_details["shape"][0]):
+                              (self.interpreter, self.input_details, self.output_details)}
+
+    def _interpreter_for(self, batch_size):
+        """The interpreter allocated for batch_size, created on first use (least recently used evicted)"""
+        entry = self._interpreters.pop(batch_size, None)
+        if entry is None:
+            interpreter = self._make_interpreter()
+            input_index = interpreter.get_input_details()[0]["index"]
+            interpreter.resize_tensor_input(input_index, [batch_size] + list(self.input_details["shape"][1:]))
+            interpreter.allocate_tensors()
+            entry = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0])
+            if len(self._interpreters) >= self.MAX_INTERPRETERS:
+                del self._interpreters[next(iter(self._interpreters))]
+        self._interpreters[batch_size] = entry
+        return entry
+
+    def predict_batch(self, batch):
+        count = len(batch)
+        padded = 1 << (count - 1).bit_length()
+        interpreter, input_details, output_details = self._interpreter_for(padded)
+        if padded != count:
+            batch = np.concatenate([batch, np.zeros((padded - count,) + batch.shape[1:], batch.dtype)])
+
+        # Quantize the input for full-integer models
+        input_dtype = input_details["dtype"]
+        if input_dtype in (np.int8, np.uint8):
+            scale, zero_point = input_details["quantization"]
+            info = np.iinfo(input_dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        interpreter.set_tensor(input_details["index"], batch.astype(input_dtype))
+        interpreter.invoke()
+
+        output = interpreter.get_tensor(output_details["index"])
+        if output_details["dtype"] in (np.int8, np.uint8):
+            scale, zero_point = output_details["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output[:count, 0]
+
+
+BACKENDS = {"keras": KerasBackend, "savedmodel": SavedModelBackend, "tflite": TFLiteBackend}
+
+
+def make_backend(model_path, backend=None):
+    """Create the backend for model_path, chosen from the file extension by default"""
+    if backend is None:
+        backend = "tflite" if model_path.endswith(".tflite") else "keras"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](model_path)
+
+
+class InferenceEngine:
+    """Loads the trained CNN once and keeps it warm for repeated predictions"""
+
+    def __init__(self, model_path=MODEL_PATH, backend=None):
+        self.model_path = model_path
+        self.backend = make_backend(model_path, backend)
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_time = None
+        self.last_latency = None
+        self.single_latency = None  # last single-view prediction, to compare TTA against
+        self.prediction_count = 0
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    def load(self):
+        """Load the model if it is not loaded yet (safe to call from any thread)"""
+        with self._lock:
+            if self.state == READY:
+                return self.backend
+            self.state = LOADING
+            self.error = None
+            start = time.perf_counter()
+            try:
+                if not os.path.exists(self.model_path):
+                    raise FileNotFoundError(
+                        f"Model file '{self.model_path}' not found. Train it with model.py first.")
+
+                # TensorFlow is imported inside the backend so the app window never waits on it
+                self.backend.load()
+                self.load_time = time.perf_counter() - start
+                self.state = READY
+            except Exception as e:
+                self.error = e
+                self.state = FAILED
+                raise
+            finally:
+                self._loaded.set()
+            return self.backend
+
+    def load_async(self):
+        """Start loading the model in a background thread"""
+        if self.state in (LOADING, READY):
+            return
+        self._loaded.clear()
+        self.state = LOADING
+        thread = threading.Thread(target=self._load_quietly, daemon=True)
+        thread.start()
+
+    def _load_quietly(self):
+        try:
+            self.load()
+        except Exception:
+            # The error is kept on the engine and re-raised on the next predict
+            pass
+
+    def wait_until_loaded(self, timeout=None):
+        """Block until a load attempt has finished"""
+        return self._loaded.wait(timeout)
+
+    def is_ready(self):
+        return self.state == READY
+
+    def predict(self, image):
+        """Return the Monkeypox probability (0.0 - 1.0) for a single image"""
+        if self.state != READY:
+            self.load()
+
+        start = time.perf_counter()
+        batch = np.expand_dims(preprocess_image(image), axis=0)
+        probability = float(self.backend.predict_batch(batch)[0])
+        self.last_latency = self.single_latency = time.perf_counter() - start
+        self.prediction_count += 1
+        return probability
+
+    def predict_tta(self, image, views=TTA_VIEWS):
+        """Return (mean probability, spread) over augmented views run as one batch
+
+        spread is the standard deviation of the view probabilities; a large
+        value means the prediction depends on framing.
+        """
+        if self.state != READY:
+            self.load()
+
+        start = time.perf_counter()
+        probabilities = np.asarray(self.backend.predict_batch(tta_views(image, views)), dtype=np.float32)
+        self.last_latency = time.perf_counter() - start
+        self.prediction_count += 1
+        return float(probabilities.mean()), float(probabilities.std())
+
+    def tta_overhead(self, image, views=TTA_VIEWS, repeats=5):
+        """Median latency of single-view and TTA prediction of the same image"""
+        image = preprocess_image(image)
+        # Each batch shape is warmed up and then timed in a run of its own,
+        # so no timed call pays for switching shapes
+        single, tta = [], []
+        self.predict(image)
+        for _ in range(repeats):
+            self.predict(image)
+            single.append(self.last_latency)
+        self.predict_tta(image, views)
+        for _ in range(repeats):
+            self.predict_tta(image, views)
+            tta.append(self.last_latency)
+        single_ms, tta_ms = float(np.median(single)) * 1000, float(np.median(tta)) * 1000
+        return {"views": views, "single_ms": single_ms, "tta_ms": tta_ms,
+                "overhead_ms": tta_ms - single_ms, "overhead_ratio": tta_ms / single_ms if single_ms else None}
+
+    def predict_batch(self, images):
+        """Return Monkeypox probabilities for a batch of preprocessed images
+
+        images is a (N, 224, 224, 3) array, uint8 or already normalized floats.
+        """
+        if self.state != READY:
+            self.load()
+
+        start = time.perf_counter()
+        batch = preprocess_image(np.asarray(images))
+        probabilities = self.backend.predict_batch(batch)
+        self.last_latency = time.perf_counter() - start
+        self.prediction_count += len(batch)
+        return [float(p) for p in probabilities]
+
+    def status_text(self):
+        """Short human readable description of the engine state"""
+        if self.state == READY:
+            text = f"Model ready ({self.backend.name}, loaded in {self.load_time:.2f}s)"
+            if self.last_latency is not None:
+                text += f", last prediction {self.last_latency * 1000:.0f} ms"
+            return text
+        if self.state == FAILED:
+            return f"Model failed to load: {self.error}"
+        return f"Model {self.state}"
+
+
+_engine = None
+
+
+def get_engine(model_path=MODEL_PATH, backend=None):
+    """Return the shared engine instance (created on first call, not loaded)"""
+    global _engine
+    if _engine is None:
+        _engine = InferenceEngine(model_path, backend)
+    return _engine
@@ -3,29 +3,47 @@
 
 
 # main.py
+from startup import StartupTimer
+
+# Created before the other imports so that they count towards startup time
+startup_timer = StartupTimer()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-from datetime import datetime
-import csv
-import random
+import threading
+import time
 import webbrowser
 
-# Try to import PIL for image handling
-try:
-    from PIL import Image, ImageTk, ImageOps
+from prediction_cache import PredictionCache, cached_predict
+from results_store import BufferedResultWriter, open_store
+from results_viewer import ResultsViewer
+from worker import BackgroundWorker
+
+APP_VERSION = "1.0"
+STATS_POLL_MS = 250  # how often the statistics panel checks for newly committed results
+
+# Pillow, numpy (via inference and batch) and TensorFlow are imported on
+# first use or by the warm-up job after the window is drawn
+_pil = None
+
 
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-    messagebox.showwarning("PIL Not Available",
-                           "PIL/Pillow library is not installed. Image preview will be limited.\n"
-                           "Please install it with: pip install pillow")
+def load_pil():
+    """Import Pillow on first use; returns (Image, ImageTk, ImageOps) or None if missing"""
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image, ImageTk, ImageOps
+            _pil = (Image, ImageTk, ImageOps)
+        except ImportError:
+            _pil = False
+    return _pil or None
 
 
 class MonkeyPoxDetector:
-    def __init__(self, root):
+    def __init__(self, root, startup_timer=None):
         self.root = root
+        self.startup_timer = startup_timer or StartupTimer()
         self.root.title("MonkeyPox Detection System")
         self.root.geometry("1100x700")
         self.root.configure(bg='#e8f4f8')
@@ -35,18 +53,59 @@ class MonkeyPoxDetector:
 
         # Initialize variables
         self.image_path = None
-        self.current_image = None
-
-
-        # Create CSV file if it doesn't exist
-        self.csv_file = "predictions.csv"
-        if not os.path.exists(self.csv_file):
-            with open(self.csv_file, 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["Timestamp", "Image Path", "Prediction", "Confidence", "Monkeypox Probability"])
+        self.current_input = None  # 224x224 model input decoded with the preview
+        self._engine = None
+        self.pil_warning_shown = False
+        self.cache = PredictionCache()
+        self.worker = BackgroundWorker(self.root)
+        self.prediction_pending = False
+
+        # Open the results database (imports an old predictions.csv once)
+        self.store = open_store()
+        # Results are committed in batches by a background thread, which
+        # flags the statistics panel for a refresh after every commit
+        self.stats_stale = threading.Event()
+        self.writer = BufferedResultWriter(self.store, on_commit=lambda count: self.stats_stale.set())
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
 
         self.create_sidebar()
         self.create_main_content()
+        self.refresh_statistics()
+        self.root.after(STATS_POLL_MS, self._watch_statistics)
+
+        # Warm up in the background once the first frame has been drawn
+        self.root.after_idle(self._on_first_frame)
+
+    @property
+    def engine(self):
+        """The shared inference engine, created on first use"""
+        if self._engine is None:
+            from inference import get_engine
+            self._engine = get_engine()
+        return self._engine
+
+    def _on_first_frame(self):
+        """Record time to first frame and start the background warm-up"""
+        self.root.update_idletasks()
+        self.startup_timer.mark("first_frame")
+        self.status_label.config(text="Loading model...")
+        self.worker.submit(self._warm_up, on_done=self._warm_up_done, on_error=self._warm_up_failed)
+
+    def _warm_up(self, progress):
+        """Import the heavy dependencies and load the model (worker thread)"""
+        load_pil()
+        self.engine.load()
+        return self.engine.backend.name
+
+    def _warm_up_done(self, backend):
+        self.startup_timer.mark("model_ready")
+        self.startup_timer.save(version=APP_VERSION, backend=backend)
+        self.status_label.config(text=self.engine.status_text())
+
+    def _warm_up_failed(self, error):
+        # Not fatal: the model may be trained later, predict() reports the error
+        self.startup_timer.save(version=APP_VERSION, error=str(error))
+        self.status_label.config(text=self.engine.status_text())
 
     def center_window(self):
         """Center the window on the screen"""
@@ -78,6 +137,7 @@ class MonkeyPoxDetector:
         # Buttons
         buttons = [
             ("📁 Upload Image", self.upload_image),
+            ("📂 Analyze Folder", self.analyze_folder),
             ("📊 View Results", self.view_results),
             ("🩺 Doctor Recommendations", self.show_doctor_recommendations),
             ("🍎 Food Suggestions", self.show_food_suggestions),
@@ -147,6 +207,12 @@ class MonkeyPoxDetector:
                                      command=self.predict, state=tk.DISABLED, padx=15, pady=5)
         self.predict_btn.pack(side=tk.LEFT, padx=10)
 
+        # Test-time augmentation averages flipped and cropped views in one batch
+        self.tta_enabled = tk.BooleanVar(value=False)
+        tta_check = tk.Checkbutton(button_frame, text="TTA", variable=self.tta_enabled,
+                                   font=("Arial", 11), bg='#e8f4f8', activebackground='#e8f4f8')
+        tta_check.pack(side=tk.LEFT, padx=10)
+
         # Right frame for results
         right_frame = tk.Frame(content_frame, bg='#e8f4f8', width=300)
         right_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=(10, 0))
@@ -188,20 +254,17 @@ class MonkeyPoxDetector:
                                font=("Arial", 12, "bold"), bg='#f8f9fa', fg='#2c3e50')
         stats_title.pack(pady=(10, 5))
 
-        # Sample stats
-        stats_data = [
-            ("Total Analyses", "24"),
-            ("Monkeypox Detected", "8"),
-            ("Accuracy", "92.3%")
-        ]
-
-        for label, value in stats_data:
+        # Live stats from the running aggregates in the results database
+        self.stat_labels = {}
+        for label in ("Total Analyses", "Monkeypox Detected", "Analyses Today", "Recent Mean Probability"):
             stat_row = tk.Frame(stats_frame, bg='#f8f9fa')
             stat_row.pack(fill=tk.X, padx=10, pady=2)
             tk.Label(stat_row, text=label, font=("Arial", 10),
                      bg='#f8f9fa', fg='#7f8c8d').pack(side=tk.LEFT)
-            tk.Label(stat_row, text=value, font=("Arial", 10, "bold"),
-                     bg='#f8f9fa', fg='#2c3e50').pack(side=tk.RIGHT)
+            value = tk.Label(stat_row, text="-", font=("Arial", 10, "bold"),
+                             bg='#f8f9fa', fg='#2c3e50')
+            value.pack(side=tk.RIGHT)
+            self.stat_labels[label] = value
 
         # Status bar
         status_bar = tk.Frame(main_frame, bg='#2c3e50', height=25)
@@ -212,9 +275,14 @@ class MonkeyPoxDetector:
         self.status_label.pack(side=tk.LEFT, padx=10)
 
         # Add version info
-        version_label = tk.Label(status_bar, text="v1.0", fg="white", bg="#2c3e50", font=("Arial", 10))
+        version_label = tk.Label(status_bar, text=f"v{APP_VERSION}", fg="white", bg="#2c3e50", font=("Arial", 10))
         version_label.pack(side=tk.RIGHT, padx=10)
 
+        # Prediction cache counters
+        self.cache_label = tk.Label(status_bar, text=self.cache.stats_text(), fg="#bdc3c7",
+                                    bg="#2c3e50", font=("Arial", 10))
+        self.cache_label.pack(side=tk.RIGHT, padx=10)
+
     def upload_image(self):
         """Upload an image from file"""
         file_path = filedialog.askopenfilename(
@@ -223,26 +291,37 @@ class MonkeyPoxDetector:
         )
         if file_path:
             self.image_path = file_path
-            self.display_image(file_path)
-            self.predict_btn.config(state=tk.NORMAL)
-            self.status_label.config(text=f"Loaded: {os.path.basename(file_path)}")
+            info = self.display_image(file_path)
+            if not self.prediction_pending:
+                self.predict_btn.config(state=tk.NORMAL)
+            text = f"Loaded: {os.path.basename(file_path)}"
+            if info:
+                (width, height), (decoded_width, decoded_height) = info["original_size"], info["decoded_size"]
+                text += (f" ({width}x{height}, decoded at {decoded_width}x{decoded_height}, "
+                         f"{info['decoded_bytes'] / (1024 * 1024):.1f} MB, {info['seconds'] * 1000:.0f} ms)")
+            self.status_label.config(text=text)
 
     def display_image(self, path):
-        """Display the selected image"""
-        if PIL_AVAILABLE:
+        """Display the selected image; returns decode statistics, or None if not decoded
+
+        One reduced-resolution decode feeds both the preview and the model
+        input, and no full-size copy of the image is kept.
+        """
+        self.current_input = None
+        pil = load_pil()
+        if pil:
+            _, ImageTk, ImageOps = pil
             try:
-                img = Image.open(path)
-                self.current_image = img.copy()
-
-                # Resize image to fit in the display area
-                img.thumbnail((400, 400))
+                from inference import PREVIEW_SIZE, load_preview
+                preview, self.current_input, info = load_preview(path, PREVIEW_SIZE)
 
                 # Create a bordered image
-                bordered_img = ImageOps.expand(img, border=2, fill='#3498db')
+                bordered_img = ImageOps.expand(preview, border=2, fill='#3498db')
                 img_tk = ImageTk.PhotoImage(bordered_img)
 
                 self.img_label.configure(image=img_tk, text="")
                 self.img_label.image = img_tk  # Keep a reference
+                return info
             except Exception as e:
                 self.img_label.configure(
                     text=f"Error loading image: {str(e)}",
@@ -254,33 +333,74 @@ class MonkeyPoxDetector:
                 text=f"Image: {os.path.basename(path)}\n\n(PIL not installed for preview)",
                 font=("Arial", 10)
             )
+            if not self.pil_warning_shown:
+                self.pil_warning_shown = True
+                messagebox.showwarning("PIL Not Available",
+                                       "PIL/Pillow library is not installed. Image preview will be limited.\n"
+                                       "Please install it with: pip install pillow")
 
     def predict(self):
-        """Simulate prediction (in a real app, this would use a trained model)"""
+        """Run the trained CNN on the selected image in the background"""
+        # Ignore repeated clicks while an analysis is still running
+        if not self.image_path or self.prediction_pending:
+            return
+
+        self.prediction_pending = True
+        self.predict_btn.config(state=tk.DISABLED)
+
+        # Show loading state
+        self.result_label.config(text="Analyzing...", fg='#f39c12')
+        self.confidence_bar['value'] = 0
+        self.confidence_value.config(text="0%")
+        self.status_label.config(text="Analyzing image...")
+
+        image_path = self.image_path
+        tta = self.tta_enabled.get()
+        self.worker.submit(
+            self._perform_prediction, image_path, self.current_input, tta,
+            on_progress=self._show_progress,
+            on_done=lambda result: self._show_prediction(image_path, *result, tta=tta),
+            on_error=self._show_prediction_error
+        )
+
+    def _perform_prediction(self, image_path, image, tta, progress):
+        """Perform the actual prediction with the inference engine (worker thread)
+
+        Returns (probability, seconds, was_cached).
+        """
+        start = time.perf_counter()
+        progress(10, "Checking cache...")
+        probability, cached, image_hash = cached_predict(self.engine, self.cache, image_path, image, tta)
+        return probability, time.perf_counter() - start, cached, image_hash
+
+    def _show_progress(self, value, text):
+        """Update the progress display with a worker report"""
+        self.confidence_bar['value'] = value
+        self.confidence_value.config(text=f"{value}%")
+        if text:
+            self.status_label.config(text=text)
+
+    def _finish_prediction(self):
+        """Allow a new analysis once the current one has been delivered"""
+        self.prediction_pending = False
         if self.image_path:
-            # Show loading state
-            self.result_label.config(text="Analyzing...", fg='#f39c12')
-            self.confidence_bar['value'] = 0
-            self.confidence_value.config(text="0%")
-            self.status_label.config(text="Analyzing image...")
-            self.root.update()
-
-            # Simulate processing time with progress
-            for i in range(1, 101):
-                self.confidence_bar['value'] = i
-                self.confidence_value.config(text=f"{i}%")
-                self.root.update()
-                self.root.after(20)  # Short delay for animation
-
-            # Perform the actual prediction
-            self._perform_prediction()
-
-    def _perform_prediction(self):
-        """Perform the actual prediction after a delay"""
-        # Simulate prediction with random results for demonstration
-        # In a real application, this would use your trained CNN model
-        is_monkeypox = random.choice([True, False])
-        confidence = random.uniform(80.0, 95.0) if is_monkeypox else random.uniform(5.0, 30.0)
+            self.predict_btn.config(state=tk.NORMAL)
+
+    def _show_prediction_error(self, error):
+        """Show a failed analysis"""
+        self._finish_prediction()
+        self.result_label.config(text="Analysis failed", fg='#e74c3c')
+        self.confidence_bar['value'] = 0
+        self.confidence_value.config(text="0%")
+        self.status_label.config(text=self.engine.status_text())
+        messagebox.showerror("Prediction Error", f"Could not analyze image: {str(error)}")
+
+    def _show_prediction(self, image_path, probability, seconds, cached, image_hash, tta=False):
+        """Show the prediction result and save it"""
+        self._finish_prediction()
+        self.cache_label.config(text=self.cache.stats_text())
+        is_monkeypox = probability >= 0.5
+        confidence = (probability if is_monkeypox else 1 - probability) * 100
 
         # Update UI
         if is_monkeypox:
@@ -294,94 +414,127 @@ class MonkeyPoxDetector:
         self.confidence_bar['value'] = confidence
         self.confidence_value.config(text=f"{confidence:.2f}%")
 
-        # Save to CSV
-        self.save_to_csv(is_monkeypox, confidence)
+        # Save to the results database
+        self.save_result(image_path, probability, image_hash)
 
         # Show message if confidence is high
         if confidence >= 80:
             messagebox.showinfo("High Confidence",
                                 f"Prediction made with {confidence:.2f}% confidence")
 
-        self.status_label.config(text="Analysis complete")
+        source = "cached" if cached else "model"
+        detail = f"{source}, {seconds * 1000:.0f} ms"
+        if tta and not cached:
+            detail += ", TTA"
+            if self.engine.single_latency is not None:
+                detail += f" vs {self.engine.single_latency * 1000:.0f} ms single view"
+        self.status_label.config(text=f"Analysis complete ({detail})")
+
+    def analyze_folder(self):
+        """Analyze every image in a folder in the background"""
+        if self.prediction_pending:
+            return
+        directory = filedialog.askdirectory(title="Select a folder of images")
+        if not directory:
+            return
+
+        self.prediction_pending = True
+        self.predict_btn.config(state=tk.DISABLED)
+        self.result_label.config(text="Analyzing folder...", fg='#f39c12')
+        self.confidence_bar['value'] = 0
+        self.confidence_value.config(text="0%")
+        self.status_label.config(text=f"Scanning {os.path.basename(directory)}...")
+
+        self.worker.submit(
+            self._perform_folder_analysis, directory,
+            on_progress=self._show_progress,
+            on_done=self._show_folder_summary,
+            on_error=self._show_prediction_error
+        )
 
-    def save_to_csv(self, is_monkeypox, confidence):
-        """Save prediction results to CSV file"""
+    def _perform_folder_analysis(self, directory, progress):
+        """Score a folder with the inference engine (worker thread)"""
+        from batch import score_folder
+        if not self.engine.is_ready():
+            progress(0, "Loading model...")
+            self.engine.load()
+        return score_folder(directory, engine=self.engine, store=self.writer, progress=progress)
+
+    def _show_folder_summary(self, summary):
+        """Show the outcome of a folder analysis"""
+        self._finish_prediction()
+        self.result_label.config(text=f"{summary['scored']} images analyzed", fg='#2c3e50')
+        self.confidence_bar['value'] = 100
+        self.confidence_value.config(text="100%")
+        self.status_label.config(
+            text=f"Folder complete ({summary['images_per_second']:.1f} images/s)")
+
+        message = (f"Analyzed {summary['scored']} images in {summary['seconds']:.1f} seconds "
+                   f"({summary['images_per_second']:.1f} images/s).\n"
+                   f"Results were saved to {self.store.path}.")
+        if summary["failed"]:
+            message += f"\n\n{len(summary['failed'])} files could not be read."
+        messagebox.showinfo("Folder Analysis Complete", message)
+
+    def _watch_statistics(self):
+        """Refresh the statistics once the writer has committed new results (Tk main thread)"""
+        if self.stats_stale.is_set():
+            self.stats_stale.clear()
+            self.refresh_statistics()
+        self.root.after(STATS_POLL_MS, self._watch_statistics)
+
+    def refresh_statistics(self):
+        """Show the aggregates of the committed results; reads one row, never waits for the writer"""
         try:
-            with open(self.csv_file, 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    self.image_path,
-                    "Monkeypox" if is_monkeypox else "Normal",
-                    f"{confidence:.2f}%",
-                    f"{confidence:.2f}%"
-                ])
+            stats = self.store.stats()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to save to CSV: {str(e)}")
-
-    def view_results(self):
-        """Display the results from CSV file"""
-        results_window = tk.Toplevel(self.root)
-        results_window.title("Prediction Results")
-        results_window.geometry("900x500")
-        results_window.configure(bg='#e8f4f8')
-
-        # Title
-        title = tk.Label(results_window, text="Previous Analysis Results",
-                         font=("Arial", 16, "bold"), bg='#e8f4f8', fg='#2c3e50')
-        title.pack(pady=10)
-
-        # Create a frame for the table
-        table_frame = tk.Frame(results_window, bg='#e8f4f8')
-        table_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Create a treeview widget
-        columns = ("Timestamp", "Image", "Prediction", "Confidence")
-        tree = ttk.Treeview(table_frame, columns=columns, show="headings")
-
-        # Define headings
-        tree.heading("Timestamp", text="Timestamp")
-        tree.heading("Image", text="Image")
-        tree.heading("Prediction", text="Prediction")
-        tree.heading("Confidence", text="Confidence")
-
-        # Define columns
-        tree.column("Timestamp", width=150)
-        tree.column("Image", width=300)
-        tree.column("Prediction", width=100)
-        tree.column("Confidence", width=100)
-
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        # Style the treeview
-        style = ttk.Style()
-        style.configure("Treeview.Heading", font=('Arial', 10, 'bold'))
-        style.configure("Treeview", font=('Arial', 10), rowheight=25)
+            self.status_label.config(text=f"Could not read statistics: {str(e)}")
+            return
+
+        detections = f"{stats['detections']}"
+        if stats["total"]:
+            detections += f" ({stats['detections'] / stats['total']:.0%})"
+        rolling_mean = stats["rolling_mean_probability"]
+        values = {
+            "Total Analyses": f"{stats['total']}",
+            "Monkeypox Detected": detections,
+            "Analyses Today": f"{stats['today']}",
+            "Recent Mean Probability": "-" if rolling_mean is None else f"{rolling_mean:.1%}"
+        }
+        for label, value in values.items():
+            self.stat_labels[label].config(text=value)
 
-        # Read and display CSV content
+    def save_result(self, image_path, probability, image_hash=None):
+        """Save a prediction to the results database"""
         try:
-            with open(self.csv_file, 'r') as file:
-                reader = csv.reader(file)
-                next(reader)  # Skip header
-                for row in reader:
-                    if len(row) >= 5:
-                        # Shorten the image path for display
-                        short_path = os.path.basename(row[1]) if len(row[1]) > 30 else row[1]
-                        tree.insert("", tk.END, values=(row[0], short_path, row[2], row[3]))
+            self.writer.add(image_path, probability, image_hash)
         except Exception as e:
-            error_label = tk.Label(table_frame, text=f"Error reading results: {str(e)}",
-                                   fg="red", bg='#e8f4f8')
-            error_label.pack(pady=20)
+            messagebox.showerror("Error", f"Failed to save result: {str(e)}")
+
+    def export_results(self):
+        """Export the results database to a CSV file"""
+        file_path = filedialog.asksaveasfilename(
+            title="Export results",
+            defaultextension=".csv",
+            initialfile="predictions.csv",
+            filetypes=[("CSV files", "*.csv")]
+        )
+        if file_path:
+            try:
+                if not self.writer.flush():
+                    raise RuntimeError(f"recent results are not saved yet ({self.writer.error})")
+                count = self.store.export_csv(file_path)
+                messagebox.showinfo("Export Complete", f"Exported {count} results to {file_path}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to export results: {str(e)}")
 
-        # Close button
-        close_btn = tk.Button(results_window, text="Close", font=("Arial", 12),
-                              bg="#95a5a6", fg="white", relief=tk.RAISED,
-                              command=results_window.destroy, padx=15, pady=5)
-        close_btn.pack(pady=10)
+    def view_results(self):
+        """Display the results from the results database"""
+        if not self.writer.flush():
+            messagebox.showwarning("Results Not Saved",
+                                   f"Recent results could not be saved yet and are not shown: "
+                                   f"{self.writer.error}")
+        ResultsViewer(self.root, self.store, on_export=self.export_results)
 
     def show_doctor_recommendations(self):
         """Show doctor recommendations window with grid layout"""
@@ -937,10 +1090,19 @@ class MonkeyPoxDetector:
 
     def exit_app(self):
         """Exit the application"""
+        # A folder analysis stops after its current batch; wait for it so
+        # the batch reaches the writer before the writer is closed
+        self.worker.shutdown(wait=True)
+        self.cache.close()
+        try:
+            self.writer.close()
+        except RuntimeError as e:
+            messagebox.showerror("Error", f"Failed to save results: {str(e)}")
+        self.store.close()
         self.root.quit()
 
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = MonkeyPoxDetector(root)
+    app = MonkeyPoxDetector(root, startup_timer)
     root.mainloop()
\ No newline at end of file
@@ -2,9 +2,9 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-from datetime import datetime
-import csv
-import random
+
+from inference import get_engine
+from results_store import open_store
 
 
 class MonkeyPoxDetector:
@@ -16,17 +16,17 @@ class MonkeyPoxDetector:
 
         # Initialize variables
         self.image_path = None
+        self.engine = get_engine()
 
-        # Create Excel file if it doesn't exist
-        self.csv_file = "predictions.csv"
-        if not os.path.exists(self.csv_file):
-            with open(self.csv_file, 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["Timestamp", "Image Path", "Prediction", "Confidence", "Monkeypox Probability"])
+        # Open the results database (imports an old predictions.csv once)
+        self.store = open_store()
 
         self.create_sidebar()
         self.create_main_content()
 
+        # Warm up the model in the background once the window is shown
+        self.root.after(200, self.engine.load_async)
+
     def create_sidebar(self):
         """Create the sidebar with navigation buttons"""
         sidebar = tk.Frame(self.root, bg='#2c3e50', width=200)
@@ -114,12 +114,16 @@ class MonkeyPoxDetector:
         )
 
     def predict(self):
-        """Simulate prediction (in a real app, this would use a trained model)"""
+        """Run the trained CNN on the selected image"""
         if self.image_path:
-            # Simulate prediction with random results for demonstration
-            # In a real application, this would use your trained CNN model
-            is_monkeypox = random.choice([True, False])
-            confidence = random.uniform(80.0, 95.0) if is_monkeypox else random.uniform(5.0, 30.0)
+            try:
+                probability = self.engine.predict(self.image_path)
+            except Exception as e:
+                messagebox.showerror("Prediction Error", f"Could not analyze image: {str(e)}")
+                return
+
+            is_monkeypox = probability >= 0.5
+            confidence = (probability if is_monkeypox else 1 - probability) * 100
 
             # Update UI
             if is_monkeypox:
@@ -133,32 +137,24 @@ class MonkeyPoxDetector:
             self.confidence_bar['value'] = confidence
             self.confidence_value.config(text=f"{confidence:.2f}%")
 
-            # Save to CSV
-            self.save_to_csv(is_monkeypox, confidence)
+            # Save to the results database
+            self.save_result(probability)
 
             # Show message if confidence is high
             if confidence >= 80:
                 messagebox.showinfo("High Confidence",
                                     f"Prediction made with {confidence:.2f}% confidence")
 
-    def save_to_csv(self, is_monkeypox, confidence):
-        """Save prediction results to CSV file"""
+    def save_result(self, probability):
+        """Save prediction results to the results database"""
         try:
-            with open(self.csv_file, 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    self.image_path,
-                    "Monkeypox" if is_monkeypox else "Normal",
-                    f"{confidence:.2f}%",
-                    f"{confidence:.2f}%"
-                ])
-            messagebox.showinfo("Success", "Results saved to CSV file")
+            self.store.add(self.image_path, probability)
+            messagebox.showinfo("Success", "Results saved")
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to save to CSV: {str(e)}")
+            messagebox.showerror("Error", f"Failed to save results: {str(e)}")
 
     def view_results(self):
-        """Display the results from CSV file"""
+        """Display the most recent results from the results database"""
         results_window = tk.Toplevel(self.root)
         results_window.title("Prediction Results")
         results_window.geometry("800x400")
@@ -167,11 +163,11 @@ class MonkeyPoxDetector:
         text_widget = tk.Text(results_window, wrap=tk.WORD)
         text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-        # Read and display CSV content
+        # Read and display the latest results
         try:
-            with open(self.csv_file, 'r') as file:
-                content = file.read()
-                text_widget.insert(tk.END, content)
+            for timestamp, image_path, prediction, confidence, probability in self.store.rows(limit=500):
+                text_widget.insert(tk.END, f"{timestamp}  {prediction:10s} {confidence:6.2f}%  "
+                                           f"(Monkeypox {probability * 100:.2f}%)  {image_path}\n")
         except Exception as e:
             text_widget.insert(tk.END, f"Error reading results: {str(e)}")
 
@@ -234,6 +230,7 @@ class MonkeyPoxDetector:
 
     def exit_app(self):
         """Exit the application"""
+        self.store.close()
         self.root.quit()
 
 
@@ -1,16 +1,38 @@
 # model.py
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, GlobalAveragePooling2D
 from tensorflow.keras.optimizers import Adam
 import numpy as np
 import matplotlib.pyplot as plt
+import argparse
+import hashlib
+import json
 import os
+import shutil
 
+from data_pipeline import build_datasets
+from dataset_shards import build_shard_datasets
+from training_config import ThroughputCallback, apply_runtime_config, load_config
 
-def create_model(input_shape=(224, 224, 3)):
+
+# Classifier heads for create_model:
+#   "flatten" - Flatten -> Dense(512), the original head (~19M weights)
+#   "gap"     - GlobalAveragePooling2D -> Dense(256), ~66K weights
+HEADS = ("flatten", "gap")
+
+# Settings that do not change what a run computes; a checkpoint is resumed
+# across changes to these (e.g. more epochs or another cache)
+RUN_INDEPENDENT_KEYS = ("epochs", "cache", "shards_dir", "intra_op_threads", "inter_op_threads",
+                        "model_path", "checkpoint_dir", "resume", "early_stopping_patience")
+RUN_STATE_FILE = "run.json"
+
+
+def create_model(input_shape=(224, 224, 3), head="flatten", dropout=0.5):
     """Create a CNN model for Monkeypox detection"""
+    if head not in HEADS:
+        raise ValueError(f"Unknown head '{head}', expected one of {HEADS}")
+
     model = Sequential()
 
     # Convolutional layers
@@ -27,62 +49,185 @@ def create_model(input_shape=(224, 224, 3)):
     model.add(MaxPooling2D((2, 2)))
 
     # Fully connected layers
-    model.add(Flatten())
-    model.add(Dense(512, activation='relu'))
-    model.add(Dropout(0.5))
-    model.add(Dense(1, activation='sigmoid'))  # Binary classification
+    if head == "gap":
+        model.add(GlobalAveragePooling2D())
+        model.add(Dense(256, activation='relu'))
+    else:
+        model.add(Flatten())
+        model.add(Dense(512, activation='relu'))
+    model.add(Dropout(dropout))
+    # Binary classification (kept in float32 so mixed precision stays numerically stable)
+    model.add(Dense(1, activation='sigmoid', dtype='float32'))
 
     return model
 
 
-def train_model(dataset_path):
-    """Train the CNN model on the Monkeypox dataset"""
-    # Data generators
-    train_datagen = ImageDataGenerator(
-        rescale=1. / 255,
-        shear_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True,
-        validation_split=0.2  # Using 20% for validation
-    )
+def compile_model(model, learning_rate=0.001, jit_compile=False, optimizer=None):
+    """Compile a model with the optimizer, loss and metrics used for training
 
-    # Training data
-    train_generator = train_datagen.flow_from_directory(
-        dataset_path,
-        target_size=(224, 224),
-        batch_size=32,
-        class_mode='binary',
-        subset='training'
+    optimizer replaces the Adam optimizer, e.g. to keep one restored with
+    its state from a checkpoint.
+    """
+    model.compile(
+        optimizer=optimizer or Adam(learning_rate=learning_rate),
+        loss='binary_crossentropy',
+        metrics=['accuracy'],
+        jit_compile=jit_compile
     )
+    return model
 
-    # Validation data
-    validation_generator = train_datagen.flow_from_directory(
-        dataset_path,
-        target_size=(224, 224),
-        batch_size=32,
-        class_mode='binary',
-        subset='validation'
-    )
+
+def float32_model(model, config):
+    """Return a float32 copy of a model trained under a mixed precision policy
+
+    Keras stores the policy in every layer's config, so a model saved
+    straight from a bfloat16 run would also compute in bfloat16 in the app
+    and the service, which run on CPUs without native support for it.
+    """
+    if all(layer.dtype_policy.name == "float32" for layer in model.layers):
+        return model
+    policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy("float32")
+    try:
+        copy = create_model(model.input_shape[1:], head=config["head"], dropout=config["dropout"])
+    finally:
+        tf.keras.mixed_precision.set_global_policy(policy)
+    # Mixed precision keeps the variables in float32, so the weights copy over as they are
+    copy.set_weights(model.get_weights())
+    return copy
+
+
+def run_fingerprint(dataset_path, config):
+    """Hash of the dataset location and the settings that shape the model and its training"""
+    settings = {key: value for key, value in config.items() if key not in RUN_INDEPENDENT_KEYS}
+    settings["dataset"] = os.path.abspath(dataset_path)
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class RunStateCallback(tf.keras.callbacks.Callback):
+    """Keeps the best val_loss of a run in its state file so a resumed run compares against it"""
+
+    def __init__(self, path, state):
+        super().__init__()
+        self.path = path
+        self.state = state
+
+    def on_epoch_end(self, epoch, logs=None):
+        value = (logs or {}).get("val_loss")
+        best = self.state.get("best_val_loss")
+        if value is not None and (best is None or value < best):
+            self.state["best_val_loss"] = float(value)
+            with open(self.path, 'w') as file:
+                json.dump(self.state, file)
+
+
+def training_callbacks(config, dataset_path):
+    """Checkpoint, resume and early stopping callbacks for a training config
+
+    BackupAndRestore saves the model and optimizer state after every epoch
+    and resumes from it when a run is restarted; the backup is removed once
+    training finishes. The best weights by val_loss are also kept in
+    <checkpoint_dir>/best.h5. A checkpoint is only resumed by a run with
+    the same dataset and settings (see run_fingerprint); otherwise it is
+    discarded and the run starts fresh.
+    """
+    callbacks = [ThroughputCallback(config["batch_size"])]
+
+    checkpoint_dir = config["checkpoint_dir"]
+    if checkpoint_dir:
+        backup_dir = os.path.join(checkpoint_dir, "backup")
+        best_path = os.path.join(checkpoint_dir, "best.h5")
+        state_path = os.path.join(checkpoint_dir, RUN_STATE_FILE)
+        fingerprint = run_fingerprint(dataset_path, config)
+
+        state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as file:
+                state = json.load(file)
+        resuming = config["resume"] and os.path.exists(backup_dir)
+        if resuming and state.get("fingerprint") != fingerprint:
+            print(f"Discarding the checkpoint in {backup_dir}: it is from a run with another dataset or settings")
+            resuming = False
+        if resuming:
+            print(f"Resuming from the checkpoint in {backup_dir}")
+        else:
+            if os.path.exists(backup_dir):
+                shutil.rmtree(backup_dir)
+            if os.path.exists(best_path):
+                os.remove(best_path)
+            state = {}
+        state["fingerprint"] = fingerprint
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(state_path, 'w') as file:
+            json.dump(state, file)
+
+        callbacks.append(tf.keras.callbacks.BackupAndRestore(backup_dir))
+        callbacks.append(tf.keras.callbacks.ModelCheckpoint(
+            best_path,
+            monitor='val_loss',
+            save_best_only=True,
+            # A resumed run must beat the best epoch from before the interruption
+            initial_value_threshold=state.get("best_val_loss")
+        ))
+        callbacks.append(RunStateCallback(state_path, state))
+
+    if config["early_stopping_patience"]:
+        callbacks.append(tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=config["early_stopping_patience"],
+            restore_best_weights=True,
+            verbose=1
+        ))
+    return callbacks
+
+
+def train_model(dataset_path, config=None, **overrides):
+    """Train the CNN model on the Monkeypox dataset
+
+    config is a dict or JSON file path with the keys of
+    training_config.DEFAULT_CONFIG; keyword arguments override it.
+    """
+    config = load_config(config, **overrides)
+    policy = apply_runtime_config(config)
+    print(f"Training with batch size {config['batch_size']}, {config['epochs']} epochs, "
+          f"precision policy {policy}, XLA {'on' if config['xla'] else 'off'}")
+
+    # Input pipelines (20% of each class is used for validation)
+    if config["shards_dir"]:
+        train_dataset, validation_dataset = build_shard_datasets(
+            dataset_path,
+            config["shards_dir"],
+            batch_size=config["batch_size"],
+            validation_split=0.2
+        )
+    else:
+        train_dataset, validation_dataset = build_datasets(
+            dataset_path,
+            batch_size=config["batch_size"],
+            validation_split=0.2,
+            cache=config["cache"]
+        )
 
     # Create and compile model
-    model = create_model()
-    model.compile(
-        optimizer=Adam(learning_rate=0.001),
-        loss='binary_crossentropy',
-        metrics=['accuracy']
-    )
+    model = compile_model(create_model(head=config["head"], dropout=config["dropout"]),
+                          learning_rate=config["learning_rate"],
+                          jit_compile=config["xla"])
 
     # Train the model
     history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // 32,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // 32,
-        epochs=20
+        train_dataset,
+        validation_data=validation_dataset,
+        epochs=config["epochs"],
+        callbacks=training_callbacks(config, dataset_path)
     )
 
-    # Save the model
-    model.save('monkeypox_model.h5')
+    # Save the model with the best weights seen, including epochs from before a resume,
+    # always in float32
+    if config["checkpoint_dir"]:
+        best_path = os.path.join(config["checkpoint_dir"], "best.h5")
+        if os.path.exists(best_path):
+            model.load_weights(best_path)
+    float32_model(model, config).save(config["model_path"])
 
     # Plot training history
     plt.figure(figsize=(12, 4))
@@ -110,6 +255,52 @@ def train_model(dataset_path):
 
 
 if __name__ == "__main__":
-    # Update this path to your dataset location
-    dataset_path = "data/dataset"  # Should contain two folders: Monkeypox and Normal
-    train_model(dataset_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the Monkeypox CNN")
+    # The dataset should contain two folders: Monkeypox and Normal
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--config", help="JSON file with training settings")
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--epochs", type=int)
+    parser.add_argument("--learning-rate", type=float)
+    parser.add_argument("--head", choices=HEADS)
+    parser.add_argument("--dropout", type=float)
+    parser.add_argument("--cache", help='"memory" or a cache directory')
+    parser.add_argument("--shards-dir", help="Train from preprocessed shards in this directory")
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--mixed-precision", choices=["auto", "on", "off"])
+    parser.add_argument("--xla", action="store_true", default=None, help="Enable XLA JIT compilation")
+    parser.add_argument("--model-path", help="Where to save the trained model")
+    parser.add_argument("--checkpoint-dir", help="Directory for resumable checkpoints")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", default=None,
+                        help="Start fresh even if an interrupted run left a checkpoint")
+    parser.add_argument("--patience", type=int, help="Early stopping patience in epochs (0 disables)")
+    parser.add_argument("--profile", type=int, metavar="STEPS",
+                        help="Profile STEPS training steps and report the bottleneck instead of training")
+    args = parser.parse_args()
+
+    mixed_precision = {"on": True, "off": False}.get(args.mixed_precision, args.mixed_precision)
+    if args.profile:
+        from training_profiler import profile_training
+        run = lambda path, config, **overrides: profile_training(path, config, steps=args.profile, **overrides)
+    else:
+        run = train_model
+    run(
+        args.dataset_path,
+        args.config,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        head=args.head,
+        dropout=args.dropout,
+        cache=args.cache,
+        shards_dir=args.shards_dir,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        mixed_precision=mixed_precision,
+        xla=args.xla,
+        model_path=args.model_path,
+        checkpoint_dir=args.checkpoint_dir,
+        resume=args.resume,
+        early_stopping_patience=args.patience
+    )
\ No newline at end of file
@@ -0,0 +1,131 @@
+# prediction_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = "prediction_cache.db"
+MAX_ENTRIES = 10000
+
+
+def hash_image_bytes(data):
+    """Content hash used to recognise an image no matter where it is stored"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_image_file(path):
+    with open(path, 'rb') as file:
+        return hash_image_bytes(file.read())
+
+
+def model_version(model_path):
+    """Identify a model file by name, size and modification time without reading it"""
+    stat = os.stat(model_path)
+    key = f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class PredictionCache:
+    """Persistent, size-bounded LRU cache of probabilities keyed by image hash and model version"""
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " image_hash TEXT NOT NULL,"
+            " model_version TEXT NOT NULL,"
+            " probability REAL NOT NULL,"
+            " last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (image_hash, model_version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON predictions (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def get(self, image_hash, version):
+        """Return the cached probability, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT probability FROM predictions WHERE image_hash = ? AND model_version = ?",
+                (image_hash, version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE predictions SET last_used = ? WHERE image_hash = ? AND model_version = ?",
+                (time.time_ns(), image_hash, version)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, image_hash, version, probability):
+        """Store a probability and evict the least recently used entries over the bound"""
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM predictions WHERE image_hash = ? AND model_version = ?",
+                (image_hash, version)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                (image_hash, version, probability, time.time_ns())
+            )
+            if not exists:
+                self._size += 1
+            excess = self._size - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM predictions WHERE rowid IN "
+                    "(SELECT rowid FROM predictions ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._size -= excess
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM predictions")
+            self._conn.commit()
+            self._size = 0
+
+    def stats_text(self):
+        return f"Cache: {self.hits} hits / {self.misses} misses"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_predict(engine, cache, image_path, image=None, tta=False):
+    """Predict through the cache; returns (probability, was_cached, image_hash)
+
+    A hit skips decoding and inference entirely, and does not even need
+    the model to be loaded. image may be the already decoded model input
+    for image_path, which saves decoding the file again on a miss. With
+    tta the test-time augmentation average is used and cached separately.
+    """
+    if not os.path.exists(engine.model_path):
+        engine.load()  # raises a clear "model not found" error
+
+    image_hash = hash_image_file(image_path)
+    from inference import INPUT_VERSION, TTA_VIEWS
+
+    # Inputs decoded differently may give a different answer
+    version = f"{model_version(engine.model_path)}:input{INPUT_VERSION}"
+    if tta:
+        version += f":tta{TTA_VIEWS}"
+    probability = cache.get(image_hash, version)
+    if probability is not None:
+        return probability, True, image_hash
+
+    source = image_path if image is None else image
+    probability = engine.predict_tta(source)[0] if tta else engine.predict(source)
+    cache.put(image_hash, version, probability)
+    return probability, False, image_hash
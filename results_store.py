@@ -0,0 +1,487 @@
+# results_store.py
+import argparse
+import atexit
+import csv
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+DB_FILE = "predictions.db"
+CSV_FILE = "predictions.csv"
+CSV_HEADER = ["Timestamp", "Image Path", "Prediction", "Confidence", "Monkeypox Probability"]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Columns the results viewer may sort by
+SORT_COLUMNS = ("timestamp", "image_path", "prediction", "confidence")
+
+# The rolling mean probability is an exponentially weighted mean over
+# roughly this many recent predictions
+ROLLING_WINDOW = 50
+ROLLING_ALPHA = 2 / (ROLLING_WINDOW + 1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,        -- "YYYY-MM-DD HH:MM:SS", sorts chronologically
+    image_path TEXT NOT NULL,
+    image_hash TEXT,
+    prediction TEXT NOT NULL,       -- "Monkeypox" or "Normal"
+    confidence REAL NOT NULL,       -- confidence in the prediction, 0-100
+    probability REAL NOT NULL       -- Monkeypox probability, 0-1
+);
+CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_prediction ON results (prediction, timestamp);
+-- One per sort column of the viewer; the rowid in every index is the id tie-break
+CREATE INDEX IF NOT EXISTS idx_results_image_path ON results (image_path);
+CREATE INDEX IF NOT EXISTS idx_results_prediction_id ON results (prediction);
+CREATE INDEX IF NOT EXISTS idx_results_image_hash ON results (image_hash);
+CREATE INDEX IF NOT EXISTS idx_results_confidence ON results (confidence);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+-- Running aggregates, updated in the same transaction as every insert
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total INTEGER NOT NULL,
+    detections INTEGER NOT NULL,
+    probability_sum REAL NOT NULL,
+    rolling_mean REAL               -- NULL until the first result
+);
+CREATE TABLE IF NOT EXISTS daily_counts (
+    day TEXT PRIMARY KEY,           -- "YYYY-MM-DD"
+    total INTEGER NOT NULL,
+    detections INTEGER NOT NULL
+);
+"""
+
+
+def make_record(image_path, probability, image_hash=None, timestamp=None):
+    """Build a results row from a Monkeypox probability (0.0 - 1.0)"""
+    is_monkeypox = probability >= 0.5
+    confidence = (probability if is_monkeypox else 1 - probability) * 100
+    if timestamp is None:
+        timestamp = datetime.now()
+    return (
+        timestamp.strftime(TIMESTAMP_FORMAT),
+        image_path,
+        image_hash,
+        "Monkeypox" if is_monkeypox else "Normal",
+        round(confidence, 4),
+        float(probability)
+    )
+
+
+class ResultsStore:
+    """Prediction history in SQLite (WAL mode), safe to share between threads"""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        # Databases from before the aggregates existed get them built once
+        if self._conn.execute("SELECT 1 FROM stats").fetchone() is None:
+            self.rebuild_stats()
+
+    def add(self, image_path, probability, image_hash=None, timestamp=None):
+        self.add_many([make_record(image_path, probability, image_hash, timestamp)])
+
+    def add_many(self, records):
+        """Insert records made by make_record in a single transaction"""
+        with self._lock, self._conn:
+            self._insert(records)
+
+    def _insert(self, records):
+        """Insert records and fold them into the aggregates (caller holds the lock and transaction)"""
+        self._conn.executemany(
+            "INSERT INTO results (timestamp, image_path, image_hash, prediction, confidence, probability) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            records
+        )
+
+        total, detections, probability_sum, rolling_mean = self._conn.execute(
+            "SELECT total, detections, probability_sum, rolling_mean FROM stats WHERE id = 1"
+        ).fetchone()
+        days = {}
+        for timestamp, _, _, label, _, probability in records:
+            detected = label == "Monkeypox"
+            total += 1
+            detections += detected
+            probability_sum += probability
+            rolling_mean = probability if rolling_mean is None else \
+                rolling_mean + ROLLING_ALPHA * (probability - rolling_mean)
+            day = days.setdefault(timestamp[:10], [0, 0])
+            day[0] += 1
+            day[1] += detected
+
+        self._conn.execute(
+            "UPDATE stats SET total = ?, detections = ?, probability_sum = ?, rolling_mean = ? WHERE id = 1",
+            (total, detections, probability_sum, rolling_mean)
+        )
+        self._conn.executemany(
+            "INSERT INTO daily_counts VALUES (?, ?, ?) ON CONFLICT (day) DO UPDATE SET "
+            "total = total + excluded.total, detections = detections + excluded.detections",
+            [(day, counts[0], counts[1]) for day, counts in days.items()]
+        )
+
+    def stats(self):
+        """Return the running aggregates without scanning the results"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            total, detections, probability_sum, rolling_mean = self._conn.execute(
+                "SELECT total, detections, probability_sum, rolling_mean FROM stats WHERE id = 1"
+            ).fetchone()
+            row = self._conn.execute(
+                "SELECT total, detections FROM daily_counts WHERE day = ?", (today,)
+            ).fetchone()
+        return {
+            "total": total,
+            "detections": detections,
+            "mean_probability": probability_sum / total if total else None,
+            "rolling_mean_probability": rolling_mean,
+            "today": row[0] if row else 0,
+            "today_detections": row[1] if row else 0
+        }
+
+    def daily_counts(self, days=30):
+        """Return (day, total, detections) for the most recent days with results"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT day, total, detections FROM daily_counts ORDER BY day DESC LIMIT ?", (days,)
+            ).fetchall()
+
+    def rebuild_stats(self):
+        """Recompute the aggregates from the full history (only needed if they were lost or edited)"""
+        with self._lock, self._conn:
+            total, detections, probability_sum = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(prediction = 'Monkeypox'), 0), COALESCE(SUM(probability), 0) "
+                "FROM results"
+            ).fetchone()
+            rolling_mean = None
+            for (probability,) in self._conn.execute("SELECT probability FROM results ORDER BY id"):
+                rolling_mean = probability if rolling_mean is None else \
+                    rolling_mean + ROLLING_ALPHA * (probability - rolling_mean)
+
+            self._conn.execute("DELETE FROM stats")
+            self._conn.execute("INSERT INTO stats VALUES (1, ?, ?, ?, ?)",
+                               (total, detections, probability_sum, rolling_mean))
+            self._conn.execute("DELETE FROM daily_counts")
+            self._conn.execute(
+                "INSERT INTO daily_counts SELECT substr(timestamp, 1, 10), COUNT(*), "
+                "SUM(prediction = 'Monkeypox') FROM results GROUP BY substr(timestamp, 1, 10)"
+            )
+        return total
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def rows(self, limit=None):
+        """Return (timestamp, image_path, prediction, confidence, probability) rows, newest first"""
+        sql = ("SELECT timestamp, image_path, prediction, confidence, probability "
+               "FROM results ORDER BY timestamp DESC, id DESC")
+        params = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (limit,)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def query(self, limit=100, after=None, order_by="timestamp", descending=True,
+              date_from=None, date_to=None, label=None, min_confidence=None):
+        """Return one page of (id, timestamp, image_path, prediction, confidence, probability) rows
+
+        Pages use keyset pagination: pass the (sort value, id) of the last
+        row of the previous page as after. Every sort column has an index,
+        so a page costs the same index seek no matter how deep into the
+        history it is; a label filter combined with a sort other than
+        timestamp sorts the matching rows. date_from and date_to are
+        inclusive "YYYY-MM-DD" dates.
+        """
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{order_by}'")
+
+        where, params = [], []
+        if date_from:
+            where.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("timestamp <= ?")
+            params.append(date_to + " 23:59:59")
+        if label:
+            where.append("prediction = ?")
+            params.append(label)
+        if min_confidence is not None:
+            where.append("confidence >= ?")
+            params.append(min_confidence)
+        if after is not None:
+            where.append(f"({order_by}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+
+        direction = "DESC" if descending else "ASC"
+        sql = "SELECT id, timestamp, image_path, prediction, confidence, probability FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_by} {direction}, id {direction} LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def export_csv(self, csv_file=CSV_FILE):
+        """Write the whole history to a CSV in the original predictions.csv layout"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT timestamp, image_path, prediction, confidence, probability "
+                "FROM results ORDER BY timestamp, id"
+            )
+            with open(csv_file, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(CSV_HEADER)
+                count = 0
+                while True:
+                    rows = cursor.fetchmany(10000)
+                    if not rows:
+                        break
+                    writer.writerows(
+                        (ts, path, label, f"{conf:.2f}%", f"{prob * 100:.2f}%")
+                        for ts, path, label, conf, prob in rows
+                    )
+                    count += len(rows)
+        return count
+
+    def migrate_csv(self, csv_file=CSV_FILE):
+        """Import an old predictions.csv once; returns the number of rows imported
+
+        The file is left in place. Its path is recorded so that later calls
+        do not import it again.
+        """
+        key = "migrated:" + os.path.abspath(csv_file)
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return 0
+
+        records = []
+        with open(csv_file, newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header
+            for row in reader:
+                try:
+                    records.append(_record_from_csv_row(row))
+                except ValueError:
+                    pass  # Skip malformed rows
+
+        with self._lock, self._conn:
+            self._insert(records)
+            self._conn.execute("INSERT INTO meta VALUES (?, ?)", (key, datetime.now().strftime(TIMESTAMP_FORMAT)))
+        return len(records)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Queue timeout marker: retry the failed batch without waiting for more records
+_RETRY = object()
+
+
+class _FlushRequest:
+    """A flush() call waiting for the writer thread"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.committed = False
+
+
+class BufferedResultWriter:
+    """Collects results from any thread and commits them to the store in batches
+
+    A background thread writes everything queued so far in one transaction
+    once max_batch records are waiting or flush_interval seconds have
+    passed, whichever comes first. A batch that fails to write is kept and
+    retried every flush_interval. close() (also registered with atexit)
+    writes whatever is still buffered. on_commit(count) is called on the
+    writer thread after every committed batch.
+    """
+
+    def __init__(self, store, max_batch=256, flush_interval=0.5, close_attempts=3, on_commit=None):
+        self.store = store
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.close_attempts = close_attempts
+        self.on_commit = on_commit
+        self.written = 0
+        self.error = None
+        self.unwritten = []
+        self._queue = queue.Queue()
+        self._closed = False
+        # Makes the closed check and the put atomic, so nothing lands behind the stop marker
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, image_path, probability, image_hash=None, timestamp=None):
+        """Queue one result; the timestamp is taken now, not when it is written"""
+        self.add_many([make_record(image_path, probability, image_hash, timestamp)])
+
+    def add_many(self, records):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The result writer is closed")
+            for record in records:
+                self._queue.put(record)
+
+    def flush(self, timeout=None):
+        """Wait for every result queued before this call to be written
+
+        Returns True once they are committed, or False if the write failed
+        (see error; the writer keeps retrying) or timeout ran out first.
+        """
+        request = _FlushRequest()
+        with self._lock:
+            if self._closed:
+                return not self.unwritten
+            self._queue.put(request)
+        return request.done.wait(timeout) and request.committed
+
+    def close(self):
+        """Write out the buffer and stop the writer thread
+
+        Raises RuntimeError if results were still unwritten after
+        close_attempts tries; they are left in unwritten.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self.unwritten:
+            raise RuntimeError(f"{len(self.unwritten)} results could not be written: {self.error}")
+
+    def _run(self):
+        pending = []
+        while True:
+            # Wait for the first record of a batch, then gather more for a
+            # short while. A batch that failed is retried on the same timer.
+            waiters = []
+            stop = False
+            try:
+                item = self._queue.get(timeout=self.flush_interval if pending else None)
+            except queue.Empty:
+                item = _RETRY
+            deadline = time.monotonic() + self.flush_interval
+            while item is not _RETRY:
+                if item is None:
+                    stop = True
+                elif isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                else:
+                    pending.append(item)
+
+                if stop or waiters or len(pending) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            # Drain anything already queued so the final write catches it all
+            if stop:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _FlushRequest):
+                        waiters.append(item)
+                    elif item is not None:
+                        pending.append(item)
+
+            for attempt in range(self.close_attempts if stop else 1):
+                if not pending:
+                    break
+                if attempt:
+                    time.sleep(self.flush_interval)
+                try:
+                    self.store.add_many(pending)
+                except Exception as e:
+                    # Keep the batch; it is retried after flush_interval
+                    self.error = e
+                    print(f"Failed to write {len(pending)} results: {e}", file=sys.stderr)
+                    continue
+                self.written += len(pending)
+                committed, pending = len(pending), []
+                self.error = None
+                if self.on_commit is not None:
+                    try:
+                        self.on_commit(committed)
+                    except Exception as e:
+                        print(f"Result commit callback failed: {e}", file=sys.stderr)
+
+            for waiter in waiters:
+                waiter.committed = not pending
+                waiter.done.set()
+            if stop:
+                self.unwritten = pending
+                return
+
+
+def _percent(text):
+    return float(text.strip().rstrip('%'))
+
+
+def _record_from_csv_row(row):
+    if len(row) < 5:
+        raise ValueError("Incomplete row")
+    timestamp, image_path, label, confidence, probability = row[:5]
+    confidence = _percent(confidence)
+    probability = _percent(probability) / 100
+    # Early versions wrote the confidence into the probability column too
+    if (probability >= 0.5) != (label == "Monkeypox"):
+        probability = confidence / 100 if label == "Monkeypox" else 1 - confidence / 100
+    return (timestamp, image_path, None, label, confidence, probability)
+
+
+def open_store(path=DB_FILE, legacy_csv=CSV_FILE):
+    """Open the results store, importing a legacy predictions.csv the first time"""
+    store = ResultsStore(path)
+    if legacy_csv and os.path.exists(legacy_csv):
+        imported = store.migrate_csv(legacy_csv)
+        if imported:
+            print(f"Imported {imported} results from {legacy_csv}")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the prediction results store")
+    parser.add_argument("--db", default=DB_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Import a predictions CSV file")
+    migrate.add_argument("csv_file", nargs="?", default=CSV_FILE)
+    export = commands.add_parser("export", help="Export all results to CSV")
+    export.add_argument("csv_file", nargs="?", default="predictions_export.csv")
+    commands.add_parser("rebuild-stats", help="Recompute the statistics from the full history")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.command == "migrate":
+        print(f"Imported {store.migrate_csv(args.csv_file)} rows from {args.csv_file}")
+    elif args.command == "rebuild-stats":
+        print(f"Rebuilt statistics from {store.rebuild_stats()} results")
+    else:
+        print(f"Exported {store.export_csv(args.csv_file)} rows to {args.csv_file}")
+    store.close()
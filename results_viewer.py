@@ -0,0 +1,208 @@
+# results_viewer.py
+import os
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import datetime
+
+# Treeview column -> results store column
+COLUMNS = {
+    "Timestamp": "timestamp",
+    "Image": "image_path",
+    "Prediction": "prediction",
+    "Confidence": "confidence"
+}
+
+
+class ResultsViewer:
+    """Results window that loads rows page by page as the user scrolls
+
+    Sorting and filtering are done by the results store, so opening the
+    window costs one page query however long the history is.
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, root, store, on_export=None):
+        self.store = store
+        self.sort_column = "timestamp"
+        self.descending = True
+        self.filters = {}
+        self.last_key = None
+        self.exhausted = False
+        self.loaded = 0
+        self.page_requested = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Prediction Results")
+        self.window.geometry("900x560")
+        self.window.configure(bg='#e8f4f8')
+
+        # Title
+        title = tk.Label(self.window, text="Previous Analysis Results",
+                         font=("Arial", 16, "bold"), bg='#e8f4f8', fg='#2c3e50')
+        title.pack(pady=10)
+
+        self.create_filter_bar()
+
+        # Create a frame for the table
+        table_frame = tk.Frame(self.window, bg='#e8f4f8')
+        table_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        # Create a treeview widget
+        self.tree = ttk.Treeview(table_frame, columns=tuple(COLUMNS), show="headings")
+        for column in COLUMNS:
+            self.tree.heading(column, text=column, command=lambda c=column: self.sort_by(c))
+
+        # Define columns
+        self.tree.column("Timestamp", width=150)
+        self.tree.column("Image", width=300)
+        self.tree.column("Prediction", width=100)
+        self.tree.column("Confidence", width=100)
+
+        # Add scrollbar; scrolling near the end loads the next page
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Style the treeview
+        style = ttk.Style()
+        style.configure("Treeview.Heading", font=('Arial', 10, 'bold'))
+        style.configure("Treeview", font=('Arial', 10), rowheight=25)
+
+        self.count_label = tk.Label(self.window, text="", font=("Arial", 10),
+                                    bg='#e8f4f8', fg='#7f8c8d')
+        self.count_label.pack()
+
+        # Export and close buttons
+        button_frame = tk.Frame(self.window, bg='#e8f4f8')
+        button_frame.pack(pady=10)
+
+        if on_export:
+            export_btn = tk.Button(button_frame, text="Export CSV", font=("Arial", 12),
+                                   bg="#3498db", fg="white", relief=tk.RAISED,
+                                   command=on_export, padx=15, pady=5)
+            export_btn.pack(side=tk.LEFT, padx=10)
+
+        close_btn = tk.Button(button_frame, text="Close", font=("Arial", 12),
+                              bg="#95a5a6", fg="white", relief=tk.RAISED,
+                              command=self.window.destroy, padx=15, pady=5)
+        close_btn.pack(side=tk.LEFT, padx=10)
+
+        self.update_headings()
+        self.reload()
+
+    def create_filter_bar(self):
+        """Date range, label and confidence filters"""
+        bar = tk.Frame(self.window, bg='#e8f4f8')
+        bar.pack(fill=tk.X, padx=10)
+
+        tk.Label(bar, text="From (YYYY-MM-DD):", font=("Arial", 10), bg='#e8f4f8').pack(side=tk.LEFT)
+        self.date_from = tk.Entry(bar, width=11)
+        self.date_from.pack(side=tk.LEFT, padx=(2, 10))
+
+        tk.Label(bar, text="To:", font=("Arial", 10), bg='#e8f4f8').pack(side=tk.LEFT)
+        self.date_to = tk.Entry(bar, width=11)
+        self.date_to.pack(side=tk.LEFT, padx=(2, 10))
+
+        tk.Label(bar, text="Prediction:", font=("Arial", 10), bg='#e8f4f8').pack(side=tk.LEFT)
+        self.label_choice = ttk.Combobox(bar, values=["All", "Monkeypox", "Normal"],
+                                         state="readonly", width=10)
+        self.label_choice.set("All")
+        self.label_choice.pack(side=tk.LEFT, padx=(2, 10))
+
+        tk.Label(bar, text="Min confidence %:", font=("Arial", 10), bg='#e8f4f8').pack(side=tk.LEFT)
+        self.min_confidence = tk.Entry(bar, width=6)
+        self.min_confidence.pack(side=tk.LEFT, padx=(2, 10))
+
+        apply_btn = tk.Button(bar, text="Apply", font=("Arial", 10),
+                              bg="#3498db", fg="white", relief=tk.RAISED,
+                              command=self.apply_filters, padx=10)
+        apply_btn.pack(side=tk.LEFT)
+
+    def apply_filters(self):
+        """Validate the filter inputs and reload from the first page"""
+        filters = {}
+        try:
+            for key, entry in (("date_from", self.date_from), ("date_to", self.date_to)):
+                value = entry.get().strip()
+                if value:
+                    datetime.strptime(value, "%Y-%m-%d")
+                    filters[key] = value
+            value = self.min_confidence.get().strip()
+            if value:
+                filters["min_confidence"] = float(value)
+        except ValueError:
+            messagebox.showerror("Invalid Filter",
+                                 "Dates must be YYYY-MM-DD and confidence a number.",
+                                 parent=self.window)
+            return
+
+        if self.label_choice.get() != "All":
+            filters["label"] = self.label_choice.get()
+
+        self.filters = filters
+        self.reload()
+
+    def sort_by(self, column):
+        """Sort by a column; clicking the same column again reverses the order"""
+        sort_column = COLUMNS[column]
+        if sort_column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = sort_column
+            self.descending = sort_column in ("timestamp", "confidence")
+        self.update_headings()
+        self.reload()
+
+    def update_headings(self):
+        for column, sort_column in COLUMNS.items():
+            arrow = ""
+            if sort_column == self.sort_column:
+                arrow = " ▼" if self.descending else " ▲"
+            self.tree.heading(column, text=column + arrow)
+
+    def reload(self):
+        """Drop the loaded rows and fetch the first page again"""
+        self.tree.delete(*self.tree.get_children())
+        self.last_key = None
+        self.exhausted = False
+        self.loaded = 0
+        self.load_page()
+
+    def load_page(self):
+        """Append the next page of rows"""
+        if self.exhausted:
+            return
+        try:
+            rows = self.store.query(limit=self.PAGE_SIZE, after=self.last_key,
+                                    order_by=self.sort_column, descending=self.descending,
+                                    **self.filters)
+        except Exception as e:
+            self.exhausted = True
+            self.count_label.config(text=f"Error reading results: {str(e)}", fg="red")
+            return
+
+        sort_index = 1 + list(COLUMNS.values()).index(self.sort_column)
+        for row in rows:
+            row_id, timestamp, image_path, prediction, confidence, _ = row
+            # Shorten the image path for display
+            short_path = os.path.basename(image_path) if len(image_path) > 30 else image_path
+            self.tree.insert("", tk.END, values=(timestamp, short_path, prediction, f"{confidence:.2f}%"))
+            self.last_key = (row[sort_index], row_id)
+
+        self.loaded += len(rows)
+        self.exhausted = len(rows) < self.PAGE_SIZE
+        more = "" if self.exhausted else " (scroll for more)"
+        self.count_label.config(text=f"Showing {self.loaded} results{more}", fg='#7f8c8d')
+
+    def on_scroll(self, first, last):
+        """Keep the scrollbar in sync and fetch more rows near the bottom"""
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9 and not self.exhausted and not self.page_requested:
+            self.page_requested = True
+            self.window.after_idle(self.load_requested_page)
+
+    def load_requested_page(self):
+        self.page_requested = False
+        self.load_page()
@@ -0,0 +1,324 @@
+# service.py
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from batch import decode_image_bytes
+from batching import MicroBatchScheduler, SchedulerFull
+from inference import get_engine
+from results_store import DB_FILE, BufferedResultWriter, make_record, open_store
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BATCH = 32
+MAX_WAIT_MS = 10
+QUEUE_SIZE = 256            # images being decoded or predicted before requests are refused
+MAX_CONNECTIONS = 64
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_BUFFERED_BYTES = 256 * 1024 * 1024  # request bodies held in memory at once
+MAX_HEADERS = 100
+LINGER_SECONDS = 1.0        # how long a refused request's unread upload is discarded for
+
+
+class ServiceError(Exception):
+    """An error that is reported to the client with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class PredictionService:
+    """HTTP prediction server that lets several workstations share one loaded model
+
+        python service.py --port 8765
+        curl --data-binary @lesion.jpg "http://127.0.0.1:8765/predict?name=lesion.jpg"
+        curl -F a=@one.jpg -F b=@two.jpg http://127.0.0.1:8765/predict/batch
+        curl http://127.0.0.1:8765/health
+
+    Images from concurrent requests are gathered into one model call (up to
+    max_batch images, waiting at most max_wait_ms for more). At most
+    queue_size images are being decoded or predicted at once; beyond that
+    requests get 503 with Retry-After instead of piling up, and a single
+    request with more images than that gets 413. A request is refused
+    before its body is read if the queue is already full, more than
+    max_connections are open or its body would take the bodies held in
+    memory past max_buffered_bytes. Results go to the shared results store.
+    """
+
+    def __init__(self, engine=None, writer=None, max_batch=MAX_BATCH,
+                 max_wait_ms=MAX_WAIT_MS, queue_size=QUEUE_SIZE, decode_workers=None,
+                 max_connections=MAX_CONNECTIONS, max_buffered_bytes=MAX_BUFFERED_BYTES):
+        self.engine = engine or get_engine()
+        self.writer = writer
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+        self.max_buffered_bytes = max_buffered_bytes
+        self.in_flight = 0      # images admitted whose results have not come back
+        self.connections = 0
+        self.buffered = 0       # bytes of request bodies held
+        self.decoders = ThreadPoolExecutor(max_workers=decode_workers or min(8, os.cpu_count() or 1),
+                                           thread_name_prefix="service-decode")
+        self.scheduler = MicroBatchScheduler(lambda arrays: self.engine.predict_batch(np.stack(arrays)),
+                                             max_batch_size=max_batch, max_wait_ms=max_wait_ms,
+                                             max_queue=queue_size, name="service-model")
+        self.server = None
+        self.requests = 0
+
+    async def start(self, host=HOST, port=PORT):
+        """Load the model and start listening; returns the asyncio server"""
+        await asyncio.get_running_loop().run_in_executor(None, self.engine.load)
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.decoders.shutdown(wait=False)
+        self.scheduler.close()
+
+    def stats(self):
+        return {
+            "model": self.engine.status_text(),
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "connections": self.connections,
+            "requests": self.requests,
+            **self.scheduler.metrics()
+        }
+
+    async def predict(self, items):
+        """Predict a list of (name, image bytes); returns one result dict per item"""
+        # Reserve places for the images before decoding them; they are
+        # released once the predictions are back
+        if len(items) > self.queue_size:
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"A request may contain at most {self.queue_size} images")
+        if self.in_flight + len(items) > self.queue_size:
+            self.scheduler.rejected += 1
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Prediction queue is full, retry later")
+
+        self.in_flight += len(items)
+        try:
+            loop = asyncio.get_running_loop()
+            decoded = await asyncio.gather(*(loop.run_in_executor(self.decoders, decode_image_bytes, data)
+                                             for _, data in items))
+
+            good = [i for i, d in enumerate(decoded) if d is not None]
+            try:
+                futures = self.scheduler.submit_many([decoded[i][1] for i in good])
+            except SchedulerFull:
+                raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Prediction queue is full, retry later")
+            probabilities = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+            probabilities = dict(zip(good, probabilities))
+        finally:
+            self.in_flight -= len(items)
+
+        results, records = [], []
+        for i, (name, _) in enumerate(items):
+            if decoded[i] is None:
+                results.append({"image": name, "error": "Could not decode image"})
+                continue
+            record = make_record(name, probabilities[i], decoded[i][0])
+            records.append(record)
+            _, _, image_hash, label, confidence, probability = record
+            results.append({"image": name, "prediction": label, "confidence": confidence,
+                            "probability": probability, "image_hash": image_hash})
+        if self.writer is not None and records:
+            self.writer.add_many(records)
+        return results
+
+    async def _handle_connection(self, reader, writer):
+        """Serve one request per connection"""
+        self.requests += 1
+        self.connections += 1
+        buffered = 0
+        request_read = False
+        try:
+            try:
+                if self.connections > self.max_connections:
+                    raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many connections, retry later")
+                method, target, headers, length = await _read_head(reader)
+                buffered = self._admit_body(length)
+                body = await reader.readexactly(length) if length else b""
+                request_read = True
+                status, body = await self._dispatch(method, target, headers, body)
+            except ServiceError as e:
+                status, body = e.status, {"error": e.message}
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                return
+            except Exception as e:
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+            await self._respond(writer, status, body, None if request_read else reader)
+        finally:
+            self.connections -= 1
+            self.buffered -= buffered
+
+    def _admit_body(self, length):
+        """Account for a request body about to be read; refuses it if it cannot be served now"""
+        if not length:
+            return 0
+        if self.in_flight >= self.queue_size:
+            self.scheduler.rejected += 1
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Prediction queue is full, retry later")
+        if self.buffered + length > self.max_buffered_bytes:
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many uploads in progress, retry later")
+        self.buffered += length
+        return length
+
+    async def _respond(self, writer, status, body, unread=None):
+        """Send a JSON response and close; unread is the reader of a refused, unread upload"""
+        payload = json.dumps(body).encode()
+        status = HTTPStatus(status)
+        head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(payload)}",
+                "Connection: close"]
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        try:
+            await writer.drain()
+            if unread is not None:
+                await _discard_upload(unread, writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        routes = {"/health": "GET", "/predict": "POST", "/predict/batch": "POST"}
+        if url.path not in routes:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+        if method != routes[url.path]:
+            raise ServiceError(HTTPStatus.METHOD_NOT_ALLOWED, f"{url.path} only accepts {routes[url.path]}")
+
+        if url.path == "/health":
+            return HTTPStatus.OK, self.stats()
+
+        if url.path == "/predict":
+            if not body:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "Send the image file as the request body")
+            name = parse_qs(url.query).get("name", ["upload"])[0]
+            result = (await self.predict([(name, body)]))[0]
+            if "error" in result:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, result["error"])
+            return HTTPStatus.OK, result
+
+        items = _multipart_files(headers.get("content-type", ""), body)
+        if not items:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "No image files in the request")
+        start = time.perf_counter()
+        results = await self.predict(items)
+        return HTTPStatus.OK, {"results": results, "seconds": time.perf_counter() - start}
+
+
+async def _discard_upload(reader, writer, seconds=LINGER_SECONDS):
+    """Throw away what a refused client is still sending, for a moment
+
+    Closing a socket with unread data resets the connection, and the client
+    may lose the response before reading it. Nothing read here is kept.
+    """
+    async def drain():
+        while await reader.read(64 * 1024):
+            pass
+
+    writer.write_eof()
+    try:
+        await asyncio.wait_for(drain(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def _read_head(reader):
+    """Read the head of one HTTP/1.x request; returns (method, target, headers, body length)"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Client closed the connection")
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise ServiceError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                           f"Request bodies are limited to {MAX_BODY_BYTES // (1024 * 1024)} MB")
+    return method.upper(), target, headers, length
+
+
+def _multipart_files(content_type, body):
+    """Return (filename, bytes) for every file part of a multipart/form-data body"""
+    if not content_type.startswith("multipart/form-data"):
+        raise ServiceError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Batch requests must be multipart/form-data")
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    files = []
+    for index, part in enumerate(message.iter_parts()):
+        data = part.get_payload(decode=True)
+        if data:
+            files.append((part.get_filename() or f"upload-{index}", data))
+    return files
+
+
+async def serve(host=HOST, port=PORT, db=DB_FILE, **options):
+    """Run the service until interrupted"""
+    store = open_store(db)
+    writer = BufferedResultWriter(store)
+    service = PredictionService(writer=writer, **options)
+    server = await service.start(host, port)
+    print(f"Serving predictions on http://{host}:{port} ({service.engine.status_text()})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+        try:
+            writer.close()
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Monkeypox predictions over HTTP")
+    parser.add_argument("--host", default=HOST, help="Use 0.0.0.0 to accept other workstations")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default=DB_FILE, help="Results database to write to")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, max_batch=args.max_batch,
+                          max_wait_ms=args.max_wait_ms, queue_size=args.queue_size,
+                          max_connections=args.max_connections))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,81 @@
+# startup.py
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+STARTUP_LOG = "startup_times.jsonl"
+
+
+class StartupTimer:
+    """Measures time to first frame and time to model-ready for one launch
+
+    Times are relative to when the timer is created, which main.py does
+    before any of its other imports. save() appends one JSON line per launch
+    so the numbers can be compared across releases.
+    """
+
+    def __init__(self, log_path=STARTUP_LOG):
+        self.log_path = log_path
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name):
+        """Record the first time name is reached, in seconds since start"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+        return self.marks[name]
+
+    def save(self, **extra):
+        """Append this launch to the log; failures to write are not fatal"""
+        entry = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": sys.platform,
+            "frozen": bool(getattr(sys, "frozen", False)),
+            **{name: round(seconds, 4) for name, seconds in self.marks.items()},
+            **extra
+        }
+        try:
+            with open(self.log_path, 'a') as file:
+                file.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Could not write startup times: {e}", file=sys.stderr)
+        return entry
+
+
+def summarize(log_path=STARTUP_LOG):
+    """Median startup times per app version, oldest version first"""
+    by_version = {}
+    with open(log_path) as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                by_version.setdefault(entry.get("version", "?"), []).append(entry)
+
+    summary = {}
+    for version, entries in by_version.items():
+        row = {"launches": len(entries)}
+        for mark in ("first_frame", "model_ready"):
+            values = [e[mark] for e in entries if e.get(mark) is not None]
+            row[mark] = statistics.median(values) if values else None
+        summary[version] = row
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize recorded startup times")
+    parser.add_argument("log", nargs="?", default=STARTUP_LOG)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        sys.exit(f"No startup times recorded yet ({args.log} not found)")
+    print(f"{'Version':10s}{'Launches':>10s}{'First frame':>14s}{'Model ready':>14s}")
+    for version, row in summarize(args.log).items():
+        cells = [f"{row[m]:>13.2f}s" if row[m] is not None else f"{'-':>14s}"
+                 for m in ("first_frame", "model_ready")]
+        print(f"{version:10s}{row['launches']:>10d}{''.join(cells)}")
@@ -0,0 +1,327 @@
+# sweep.py
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import split_files
+from dataset_shards import SHARDS_DIR, ShardReader, build_shards, shard_dataset
+from model import HEADS, compile_model, create_model
+from training_config import apply_runtime_config, child_thread_limit, load_config, split_cores, worker_config
+
+SWEEP_DB = "sweeps.db"
+SWEEP_DIR = "sweeps"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Successive halving: every trial trains MIN_EPOCHS, then each rung keeps
+# the best 1/ETA by validation loss and trains them ETA times longer, up
+# to the epochs of the training config
+MIN_EPOCHS = 2
+ETA = 3
+
+# Lists are tried in full by a grid search and sampled by a random search;
+# {"low": ..., "high": ..., "log": true} ranges are only for random search
+SEARCH_SPACE = {
+    "learning_rate": [0.0001, 0.0003, 0.001, 0.003],
+    "batch_size": [16, 32, 64],
+    "dropout": [0.3, 0.5],
+    "head": list(HEADS)
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    mode TEXT NOT NULL,             -- "grid" or "random"
+    space TEXT NOT NULL,            -- search space as JSON
+    base_config TEXT NOT NULL,      -- training config the trials start from, as JSON
+    seconds REAL                    -- wall time, NULL while running
+);
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    sweep_id INTEGER NOT NULL REFERENCES sweeps (id),
+    number INTEGER NOT NULL,
+    config TEXT NOT NULL,           -- swept values as JSON
+    status TEXT NOT NULL,           -- "running", "pruned", "completed" or "failed"
+    rung INTEGER,                   -- last rung the trial finished
+    epochs INTEGER,
+    val_loss REAL,                  -- after the last epoch
+    best_val_loss REAL,             -- lowest so far, used for pruning
+    val_accuracy REAL,
+    seconds REAL,                   -- training wall time over all rungs
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trials_sweep ON trials (sweep_id, best_val_loss);
+"""
+
+
+class SweepStore:
+    """Sweeps and their trials in SQLite"""
+
+    def __init__(self, path=SWEEP_DB):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def start_sweep(self, dataset_path, mode, space, base_config, configs):
+        """Record a new sweep with one running trial per config and return its id"""
+        with self._conn:
+            sweep_id = self._conn.execute(
+                "INSERT INTO sweeps (started, dataset, mode, space, base_config) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().strftime(TIMESTAMP_FORMAT), dataset_path, mode,
+                 json.dumps(space), json.dumps(base_config))
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO trials (sweep_id, number, config, status, seconds) VALUES (?, ?, ?, 'running', 0)",
+                [(sweep_id, number, json.dumps(config)) for number, config in enumerate(configs)]
+            )
+        return sweep_id
+
+    def update_trial(self, sweep_id, number, **values):
+        columns = ", ".join(f"{key} = ?" for key in values)
+        with self._conn:
+            self._conn.execute(f"UPDATE trials SET {columns} WHERE sweep_id = ? AND number = ?",
+                               (*values.values(), sweep_id, number))
+
+    def finish_sweep(self, sweep_id, seconds):
+        with self._conn:
+            self._conn.execute("UPDATE sweeps SET seconds = ? WHERE id = ?", (seconds, sweep_id))
+
+    def last_sweep(self):
+        row = self._conn.execute("SELECT MAX(id) FROM sweeps").fetchone()
+        return row[0]
+
+    def trials(self, sweep_id):
+        """Trials of a sweep as dicts, best first; failed trials come last"""
+        rows = self._conn.execute(
+            "SELECT * FROM trials WHERE sweep_id = ? ORDER BY best_val_loss IS NULL, best_val_loss, number",
+            (sweep_id,)
+        ).fetchall()
+        return [dict(row, config=json.loads(row["config"])) for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+def grid_configs(space):
+    """Every combination of the listed values"""
+    keys = sorted(space)
+    for key in keys:
+        if not isinstance(space[key], list):
+            raise ValueError(f"Grid search needs a list of values for '{key}'")
+    for values in itertools.product(*(space[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def random_configs(space, trials, seed=0):
+    """trials configs drawn from lists and (optionally log-uniform) ranges"""
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        config = {}
+        for key, values in sorted(space.items()):
+            if isinstance(values, dict):
+                low, high = values["low"], values["high"]
+                if values.get("log"):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = float(rng.uniform(low, high))
+                if isinstance(low, int) and isinstance(high, int):
+                    value = int(round(value))
+            else:
+                value = values[int(rng.integers(len(values)))]
+            config[key] = value
+        yield config
+
+
+def rung_epochs(min_epochs, max_epochs, eta=ETA):
+    """Cumulative epochs each rung trains to, e.g. [2, 6, 18, 20]"""
+    epochs = []
+    budget = min(min_epochs, max_epochs)
+    while budget < max_epochs:
+        epochs.append(budget)
+        budget *= eta
+    return epochs + [max_epochs]
+
+
+def train_trial(number, config, initial_epoch, epochs, checkpoint, shards_dir, seed=0):
+    """Train one trial up to epochs, continuing from its checkpoint (runs in a worker process)"""
+    start = time.perf_counter()
+    tf.keras.backend.clear_session()
+    apply_runtime_config(config)
+    reader = ShardReader(shards_dir)
+    (train_indices, _), (val_indices, _) = split_files(list(range(len(reader))), reader.labels.tolist(), 0.2)
+    train_ds = shard_dataset(reader, train_indices, config["batch_size"], training=True, seed=seed + number)
+    val_ds = shard_dataset(reader, val_indices, config["batch_size"], training=False)
+
+    if initial_epoch:
+        # The .h5 file holds the weights and the optimizer state but not
+        # jit_compile, so compile again around the restored optimizer
+        model = tf.keras.models.load_model(checkpoint)
+        model = compile_model(model, jit_compile=config["xla"], optimizer=model.optimizer)
+    else:
+        tf.keras.utils.set_random_seed(seed + number)
+        model = compile_model(create_model(head=config["head"], dropout=config["dropout"]),
+                              learning_rate=config["learning_rate"],
+                              jit_compile=config["xla"])
+    history = model.fit(train_ds, validation_data=val_ds, initial_epoch=initial_epoch,
+                        epochs=epochs, verbose=0).history
+    model.save(checkpoint)
+    return {
+        "number": number,
+        "epochs": epochs,
+        "val_loss": float(history["val_loss"][-1]),
+        "best_val_loss": float(min(history["val_loss"])),
+        "val_accuracy": float(history["val_accuracy"][-1]),
+        "seconds": time.perf_counter() - start
+    }
+
+
+def run_sweep(dataset_path, space=None, mode="grid", trials=20, config=None, min_epochs=MIN_EPOCHS,
+              eta=ETA, workers=None, shards_dir=SHARDS_DIR, db_path=SWEEP_DB, out_dir=SWEEP_DIR,
+              seed=0, **overrides):
+    """Search hyperparameters with parallel trials, pruning the worst ones by successive halving
+
+    space maps training config keys to candidate values (default
+    SEARCH_SPACE). Every trial and its metrics are written to the trials
+    table of db_path; the best trial's full config goes to
+    <out_dir>/<sweep id>/best_config.json for model.py --config.
+    """
+    base = load_config(config, **overrides)
+    space = SEARCH_SPACE if space is None else space
+    if mode == "grid":
+        configs = list(grid_configs(space))
+    elif mode == "random":
+        configs = list(random_configs(space, trials, seed))
+    else:
+        raise ValueError(f"Unknown search mode '{mode}', expected 'grid' or 'random'")
+    # Unknown keys raise here rather than in a worker
+    full_configs = [load_config(base, **trial) for trial in configs]
+    rungs = rung_epochs(min_epochs, base["epochs"], eta)
+
+    build_shards(dataset_path, shards_dir)
+    workers, threads, cores = split_cores(len(configs), workers)
+    full_configs = [worker_config(trial_config, threads) for trial_config in full_configs]
+
+    store = SweepStore(db_path)
+    sweep_id = store.start_sweep(dataset_path, mode, space, base, configs)
+    sweep_dir = os.path.join(out_dir, str(sweep_id))
+    os.makedirs(sweep_dir, exist_ok=True)
+    checkpoints = {n: os.path.join(sweep_dir, f"trial-{n:03d}.h5") for n in range(len(configs))}
+    print(f"Sweep {sweep_id}: {len(configs)} {mode} trials, epochs per rung {rungs}, "
+          f"{workers} processes x {threads} threads on {cores} cores")
+
+    start = time.perf_counter()
+    totals = dict.fromkeys(checkpoints, 0.0)
+    best_losses = {}
+    survivors = list(checkpoints)
+    # TensorFlow is not fork-safe, so workers are spawned
+    context = multiprocessing.get_context("spawn")
+    with child_thread_limit(threads), ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        previous = 0
+        for rung, epochs in enumerate(rungs):
+            final = rung == len(rungs) - 1
+            futures = {pool.submit(train_trial, n, full_configs[n], previous, epochs,
+                                   checkpoints[n], shards_dir, seed): n for n in survivors}
+            finished = []
+            for future in as_completed(futures):
+                number = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Trial {number} failed: {e}")
+                    store.update_trial(sweep_id, number, status="failed", rung=rung, error=str(e))
+                    continue
+                totals[number] += result["seconds"]
+                best_losses[number] = min(best_losses.get(number, math.inf), result["best_val_loss"])
+                store.update_trial(sweep_id, number, status="completed" if final else "running",
+                                   rung=rung, epochs=epochs, val_loss=result["val_loss"],
+                                   best_val_loss=best_losses[number],
+                                   val_accuracy=result["val_accuracy"], seconds=totals[number])
+                finished.append(number)
+
+            finished.sort(key=best_losses.get)
+            keep = len(finished) if final else max(1, math.ceil(len(finished) / eta))
+            survivors = finished[:keep]
+            for number in finished[keep:]:
+                store.update_trial(sweep_id, number, status="pruned")
+            for number in set(checkpoints) - set(survivors):
+                if os.path.exists(checkpoints[number]):
+                    os.remove(checkpoints[number])
+            best_loss = f"{best_losses[finished[0]]:.4f}" if finished else "-"
+            print(f"Rung {rung + 1}/{len(rungs)} ({epochs} epochs): {len(finished)} trials trained, "
+                  f"{len(survivors)} kept, best val_loss {best_loss}")
+            previous = epochs
+            if not survivors:
+                break
+
+    seconds = time.perf_counter() - start
+    store.finish_sweep(sweep_id, seconds)
+    results = store.trials(sweep_id)
+    store.close()
+
+    best = next((trial for trial in results if trial["status"] == "completed"), None)
+    if best:
+        best_config = load_config(base, **best["config"])
+        with open(os.path.join(sweep_dir, "best_config.json"), 'w') as file:
+            json.dump(best_config, file, indent=2)
+    print_trials(results)
+    print(f"Sweep finished in {seconds:.0f}s, results in {db_path} (sweep {sweep_id})")
+    if best:
+        print(f"Best trial {best['number']}: {best['config']} -> "
+              f"{os.path.join(sweep_dir, 'best_config.json')}, {checkpoints[best['number']]}")
+    return results
+
+
+def print_trials(trials):
+    print(f"{'Trial':>5s}  {'Status':10s}{'Epochs':>7s}{'Best loss':>11s}{'Val acc':>9s}{'Time s':>9s}  Config")
+    for t in trials:
+        loss = f"{t['best_val_loss']:.4f}" if t["best_val_loss"] is not None else "-"
+        accuracy = f"{t['val_accuracy']:.3f}" if t["val_accuracy"] is not None else "-"
+        print(f"{t['number']:>5d}  {t['status']:10s}{t['epochs'] or 0:>7d}{loss:>11s}{accuracy:>9s}"
+              f"{t['seconds'] or 0:>9.0f}  {json.dumps(t['config'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep with parallel trials and successive halving")
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--space", help="JSON file mapping config keys to values (default: learning rate, "
+                                        "batch size, dropout and head)")
+    parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    parser.add_argument("--trials", type=int, default=20, help="Number of random search trials")
+    parser.add_argument("--config", help="JSON file with the training settings the trials start from")
+    parser.add_argument("--epochs", type=int, help="Epochs of the trials that survive every rung")
+    parser.add_argument("--min-epochs", type=int, default=MIN_EPOCHS, help="Epochs before the first pruning")
+    parser.add_argument("--eta", type=int, default=ETA, help="Keep the best 1/ETA trials at each rung")
+    parser.add_argument("--workers", type=int, help="Parallel trial processes (default: half the cores)")
+    parser.add_argument("--shards-dir", default=SHARDS_DIR, help="Decoded image cache shared by the trials")
+    parser.add_argument("--db", default=SWEEP_DB)
+    parser.add_argument("--out-dir", default=SWEEP_DIR, help="Trial checkpoints and the best config")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--show", type=int, nargs="?", const=0, metavar="SWEEP",
+                        help="Print the trials of a sweep (default: the last one) and exit")
+    args = parser.parse_args()
+
+    if args.show is not None:
+        store = SweepStore(args.db)
+        print_trials(store.trials(args.show or store.last_sweep()))
+        store.close()
+    else:
+        search_space = None
+        if args.space:
+            with open(args.space) as file:
+                search_space = json.load(file)
+        run_sweep(args.dataset_path, search_space, args.mode, args.trials, args.config, args.min_epochs,
+                  args.eta, args.workers, args.shards_dir, args.db, args.out_dir, args.seed,
+                  epochs=args.epochs)
@@ -0,0 +1,117 @@
+# test_batching.py
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatchScheduler, SchedulerFull
+
+
+class RecordingModel:
+    """Doubles every item and remembers the batches it was called with"""
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+        self.entered = threading.Event()
+
+    def __call__(self, items):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(list(items))
+        return [item * 2 for item in items]
+
+
+def test_items_from_many_threads_are_coalesced():
+    model = RecordingModel()
+    scheduler = MicroBatchScheduler(model, max_batch_size=16, max_wait_ms=200)
+    results = {}
+
+    def client(value):
+        results[value] = scheduler.predict(value, timeout=5)
+
+    threads = [threading.Thread(target=client, args=(value,)) for value in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    assert results == {value: value * 2 for value in range(16)}
+    assert sum(len(batch) for batch in model.batches) == 16
+    assert len(model.batches) < 16
+    assert all(len(batch) <= 16 for batch in model.batches)
+
+
+def test_a_full_batch_runs_without_waiting():
+    model = RecordingModel()
+    scheduler = MicroBatchScheduler(model, max_batch_size=4, max_wait_ms=10000)
+    start = time.perf_counter()
+    futures = scheduler.submit_many([1, 2, 3, 4])
+    assert [f.result(timeout=5) for f in futures] == [2, 4, 6, 8]
+    assert time.perf_counter() - start < 1
+    scheduler.close()
+
+
+def test_a_partial_batch_is_flushed_after_max_wait():
+    model = RecordingModel()
+    scheduler = MicroBatchScheduler(model, max_batch_size=32, max_wait_ms=50)
+    start = time.perf_counter()
+    futures = scheduler.submit_many([1, 2, 3])
+    assert [f.result(timeout=5) for f in futures] == [2, 4, 6]
+    elapsed = time.perf_counter() - start
+    scheduler.close()
+
+    assert 0.04 <= elapsed < 1
+    assert model.batches == [[1, 2, 3]]
+
+
+def test_full_queue_raises_scheduler_full_and_accepts_nothing():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    scheduler = MicroBatchScheduler(model, max_batch_size=1, max_wait_ms=0, max_queue=2)
+    try:
+        first = scheduler.submit(1)
+        model.entered.wait(5)
+        waiting = scheduler.submit_many([2, 3])
+        with pytest.raises(SchedulerFull):
+            scheduler.submit(4)
+        assert scheduler.pending() == 2
+        assert scheduler.metrics()["rejected"] == 1
+    finally:
+        gate.set()
+    assert [f.result(timeout=5) for f in [first] + waiting] == [2, 4, 6]
+    scheduler.close()
+
+
+def test_more_items_than_the_queue_holds_are_refused_even_when_idle():
+    scheduler = MicroBatchScheduler(RecordingModel(), max_queue=16)
+    with pytest.raises(ValueError, match="16"):
+        scheduler.submit_many(list(range(17)))
+    assert scheduler.metrics()["rejected"] == 0
+    assert [f.result(timeout=5) for f in scheduler.submit_many(list(range(16)))] == \
+        [value * 2 for value in range(16)]
+    scheduler.close()
+
+
+def test_model_errors_reach_every_caller_in_the_batch():
+    def broken(items):
+        raise RuntimeError("model failed")
+
+    scheduler = MicroBatchScheduler(broken, max_batch_size=2, max_wait_ms=1000)
+    futures = scheduler.submit_many(["a", "b"])
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(timeout=5)
+    scheduler.close()
+
+
+def test_close_runs_queued_items_and_refuses_new_ones():
+    model = RecordingModel()
+    scheduler = MicroBatchScheduler(model, max_batch_size=32, max_wait_ms=10000)
+    futures = scheduler.submit_many([1, 2])
+    scheduler.close()
+    assert [f.result(timeout=0) for f in futures] == [2, 4]
+    with pytest.raises(RuntimeError):
+        scheduler.submit(3)
@@ -0,0 +1,44 @@
+# test_data_pipeline.py
+import os
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from data_pipeline import _prepare_cache, cache_prefix
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_cache_prefix_changes_with_the_files_and_the_seed(tmp_path):
+    a, b = str(tmp_path / "data" / "a.jpg"), str(tmp_path / "data" / "b.jpg")
+    write(a, "a")
+    write(b, "b")
+    cache = str(tmp_path / "cache")
+    prefix = cache_prefix(cache, "training", [a, b], [1.0, 0.0], seed=1)
+
+    assert cache_prefix(cache, "training", [b, a], [0.0, 1.0], seed=1) == prefix
+    assert cache_prefix(cache, "training", [a], [1.0], seed=1) != prefix
+    assert cache_prefix(cache, "training", [a, b], [1.0, 1.0], seed=1) != prefix
+    assert cache_prefix(cache, "training", [a, b], [1.0, 0.0], seed=2) != prefix
+    write(b, "changed")
+    assert cache_prefix(cache, "training", [a, b], [1.0, 0.0], seed=1) != prefix
+
+
+def test_prepare_cache_clears_stale_lockfiles_and_old_caches(tmp_path):
+    cache = str(tmp_path / "cache")
+    prefix = os.path.join(cache, "training-0000000000000001")
+    for name in ("training-0000000000000001_0.lockfile",      # left by an interrupted run
+                 "training-0000000000000002.index",           # an older file list
+                 "training-0000000000000002.data-00000-of-00001",
+                 "training-0000000000000003_0.lockfile",      # being written by another run
+                 "validation-0000000000000004.index"):
+        write(os.path.join(cache, name), "")
+
+    _prepare_cache(prefix)
+    assert sorted(os.listdir(cache)) == ["training-0000000000000003_0.lockfile",
+                                         "validation-0000000000000004.index"]
@@ -0,0 +1,151 @@
+# test_dataset_index.py
+import os
+import sys
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import dataset_index
+from dataset_index import DatasetIndex, hamming_pairs
+
+
+def walk_dataset(dataset_path):
+    """The class-folder walk of data_pipeline, without importing TensorFlow"""
+    paths, labels = [], []
+    for class_name in sorted(os.listdir(dataset_path)):
+        for name in sorted(os.listdir(os.path.join(dataset_path, class_name))):
+            paths.append(os.path.join(dataset_path, class_name, name))
+            labels.append(1.0 if class_name == "Monkeypox" else 0.0)
+    return paths, labels
+
+
+def split_files(paths, labels, validation_split=0.2):
+    train, validation = ([], []), ([], [])
+    for label in sorted(set(labels)):
+        class_paths = [p for p, l in zip(paths, labels) if l == label]
+        cut = int(validation_split * len(class_paths))
+        validation[0].extend(class_paths[:cut])
+        validation[1].extend([label] * cut)
+        train[0].extend(class_paths[cut:])
+        train[1].extend([label] * (len(class_paths) - cut))
+    return train, validation
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """Stand-ins for data_pipeline and the decoder; returns the paths decoded so far
+
+    A file holds its dHash as text, or "broken" to make the decode fail.
+    """
+    monkeypatch.setitem(sys.modules, "data_pipeline",
+                        types.SimpleNamespace(walk_dataset=walk_dataset, split_files=split_files))
+    calls = []
+
+    def inspect_image(path):
+        calls.append(os.path.basename(path))
+        with open(path) as f:
+            content = f.read()
+        if content == "broken":
+            raise ValueError("truncated")
+        return 10, 10, content
+
+    monkeypatch.setattr(dataset_index, "inspect_image", inspect_image)
+    return calls
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / "dataset"
+    write(str(root / "Monkeypox" / "a.jpg"), "00000000000000ff")
+    write(str(root / "Monkeypox" / "b.jpg"), "ffffffffffffffff")
+    write(str(root / "Others" / "c.jpg"), "0000000000000000")
+    return str(root)
+
+
+def test_hamming_pairs_finds_close_hashes_once():
+    hashes = ["0000000000000000", "0000000000000003", "ffffffffffffffff", "000000000000000f"]
+    pairs = sorted(hamming_pairs(hashes, max_distance=2))
+    assert pairs == [(0, 1, 2), (1, 3, 2)]
+
+
+def test_hamming_pairs_is_independent_of_the_block_size():
+    rng = np.random.default_rng(0)
+    hashes = [f"{int(value):016x}" for value in rng.integers(0, 2 ** 63, size=40, dtype=np.int64)]
+    hashes += hashes[:5]
+    expected = sorted(hamming_pairs(hashes, max_distance=20, block=256))
+    assert sorted(hamming_pairs(hashes, max_distance=20, block=7)) == expected
+    assert {(i, j) for i, j, distance in expected if distance == 0} >= {(i, 40 + i) for i in range(5)}
+
+
+def test_update_only_decodes_new_and_changed_files(decoded, dataset, tmp_path):
+    index_path = str(tmp_path / "index.db")
+    with DatasetIndex(dataset, index_path) as index:
+        first = index.update()
+        assert (first["indexed"], first["unchanged"]) == (3, 0)
+
+        decoded.clear()
+        second = index.update()
+        assert decoded == []
+        assert (second["indexed"], second["unchanged"], second["removed"]) == (0, 3, 0)
+
+    changed = os.path.join(dataset, "Others", "c.jpg")
+    write(changed, "0000000000000001")
+    os.utime(changed, ns=(1, 1))
+    write(os.path.join(dataset, "Others", "d.jpg"), "0f0f0f0f0f0f0f0f")
+    os.remove(os.path.join(dataset, "Monkeypox", "b.jpg"))
+
+    decoded.clear()
+    with DatasetIndex(dataset, index_path) as index:
+        third = index.update()
+        paths, labels = index.files()
+    assert sorted(decoded) == ["c.jpg", "d.jpg"]
+    assert (third["indexed"], third["unchanged"], third["removed"]) == (2, 1, 1)
+    assert [os.path.basename(path) for path in paths] == ["a.jpg", "c.jpg", "d.jpg"]
+    assert labels == [1.0, 0.0, 0.0]
+
+
+def test_unreadable_images_are_quarantined_and_moved(decoded, dataset, tmp_path):
+    write(os.path.join(dataset, "Others", "broken.jpg"), "broken")
+    quarantine = str(tmp_path / "quarantine")
+    with DatasetIndex(dataset, str(tmp_path / "index.db")) as index:
+        summary = index.update(quarantine_dir=quarantine)
+        paths, _ = index.files()
+        (path, error, moved_to), = index.quarantined()
+
+        decoded.clear()
+        assert index.update()["indexed"] == 0
+    assert summary["quarantined"] == summary["moved"] == 1
+    assert "broken.jpg" not in [os.path.basename(p) for p in paths]
+    assert (path, error) == ("Others/broken.jpg", "ValueError: truncated")
+    assert os.path.exists(moved_to) and not os.path.exists(os.path.join(dataset, "Others", "broken.jpg"))
+    assert decoded == []
+
+
+def test_near_duplicates_are_cached_until_the_files_change(decoded, dataset, tmp_path):
+    with DatasetIndex(dataset, str(tmp_path / "index.db")) as index:
+        pairs = index.near_duplicates(max_distance=8)
+        assert [(pair["path_a"], pair["path_b"], pair["same_label"]) for pair in pairs] == [
+            ("Monkeypox/a.jpg", "Others/c.jpg", False)]
+        assert index.duplicates_current(max_distance=8)
+
+        write(os.path.join(dataset, "Others", "e.jpg"), "ffffffffffffffff")
+        index.update()
+        assert not index.duplicates_current(max_distance=8)
+        assert len(index.near_duplicates(max_distance=8, refresh=False)) == 1
+        assert len(index.near_duplicates(max_distance=8)) == 2
+
+
+def test_the_default_index_is_kept_outside_the_dataset(monkeypatch, tmp_path, dataset):
+    monkeypatch.setattr(dataset_index, "INDEX_DIR", str(tmp_path / "cache"))
+    path = dataset_index.default_index_path(dataset)
+    assert not os.path.abspath(path).startswith(os.path.abspath(dataset))
+    assert dataset_index.default_index_path(dataset + os.sep) == path
+    assert dataset_index.default_index_path(str(tmp_path / "other" / "dataset")) != path
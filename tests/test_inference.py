@@ -0,0 +1,104 @@
+# test_inference.py
+import io
+import sys
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from inference import InferenceEngine, TFLiteBackend, load_image_array, load_preview, preprocess_image
+
+
+@pytest.fixture
+def photo(tmp_path):
+    """A large JPEG, so draft mode scales it down while decoding"""
+    Image = pytest.importorskip("PIL.Image")
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(1500, 2000, 3), dtype=np.uint8)
+    path = tmp_path / "photo.jpg"
+    Image.fromarray(pixels).save(path, quality=90)
+    return str(path)
+
+
+def test_every_path_gives_the_same_model_input(photo):
+    array = load_image_array(photo)
+    _, preview_array, info = load_preview(photo, (400, 400))
+    with open(photo, 'rb') as file:
+        from_bytes = load_image_array(io.BytesIO(file.read()))
+
+    assert array.shape == (224, 224, 3) and array.dtype == np.uint8
+    assert info["decoded_size"] != info["original_size"]
+    np.testing.assert_array_equal(array, preview_array)
+    np.testing.assert_array_equal(array, from_bytes)
+    np.testing.assert_array_equal(preprocess_image(photo), array.astype(np.float32) / 255.0)
+
+
+def test_the_preview_keeps_its_full_size(photo):
+    preview, _, info = load_preview(photo, (400, 400))
+    assert max(preview.size) == 400
+    assert min(info["decoded_size"]) >= 400
+
+
+class FakeInterpreter:
+    """Mimics the TFLite interpreter: the output is the mean of each input image"""
+
+    allocations = 0
+
+    def __init__(self, model_path, num_threads=None):
+        self.shape = [1, 224, 224, 3]
+
+    def allocate_tensors(self):
+        FakeInterpreter.allocations += 1
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = list(shape)
+
+    def get_input_details(self):
+        return [{"index": 0, "shape": np.array(self.shape), "dtype": np.float32, "quantization": (0.0, 0)}]
+
+    def get_output_details(self):
+        return [{"index": 1, "shape": np.array([self.shape[0], 1]), "dtype": np.float32,
+                 "quantization": (0.0, 0)}]
+
+    def set_tensor(self, index, value):
+        assert list(value.shape) == self.shape
+        self.input = value
+
+    def invoke(self):
+        self.output = self.input.reshape(len(self.input), -1).mean(axis=1, keepdims=True)
+
+    def get_tensor(self, index):
+        return self.output
+
+
+@pytest.fixture
+def fake_tflite(monkeypatch):
+    package = types.ModuleType("tflite_runtime")
+    package.interpreter = types.SimpleNamespace(Interpreter=FakeInterpreter)
+    monkeypatch.setitem(sys.modules, "tflite_runtime", package)
+    monkeypatch.setitem(sys.modules, "tflite_runtime.interpreter", package.interpreter)
+    FakeInterpreter.allocations = 0
+
+
+def test_tflite_allocates_each_batch_size_once(fake_tflite):
+    backend = TFLiteBackend("model.tflite")
+    backend.load()
+    for size in (1, 8, 1, 8, 3, 4, 1, 8):
+        batch = np.arange(size, dtype=np.float32)[:, None, None, None] * np.ones((1, 224, 224, 3), np.float32)
+        np.testing.assert_allclose(backend.predict_batch(batch), np.arange(size))
+    # Batch sizes 1, 8 and 4 (3 is padded to 4)
+    assert FakeInterpreter.allocations == 3
+
+
+def test_tta_overhead_times_each_batch_shape_in_its_own_run(fake_tflite, tmp_path):
+    model_path = tmp_path / "model.tflite"
+    model_path.write_bytes(b"")
+    engine = InferenceEngine(str(model_path))
+    sizes = []
+    predict_batch = engine.backend.predict_batch
+    engine.backend.predict_batch = lambda batch: sizes.append(len(batch)) or predict_batch(batch)
+
+    result = engine.tta_overhead(np.zeros((224, 224, 3), np.uint8), views=4, repeats=3)
+    assert sizes == [1] * 4 + [4] * 4
+    assert result["views"] == 4
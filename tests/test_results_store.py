@@ -0,0 +1,253 @@
+# test_results_store.py
+import queue
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+import results_store
+from results_store import BufferedResultWriter, ResultsStore, make_record
+
+COLUMNS = {"timestamp": 1, "image_path": 2, "prediction": 3, "confidence": 4}
+
+
+def make_records(count, start=datetime(2024, 1, 1, 8, 0, 0)):
+    # Several results share a timestamp so the id tie-break is exercised
+    return [make_record(f"img_{i:03d}.jpg", (i * 37 % 100) / 100, f"hash{i}",
+                        start + timedelta(hours=i // 3))
+            for i in range(count)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    yield store
+    store.close()
+
+
+def all_pages(store, page_size, **filters):
+    rows, after = [], None
+    column = COLUMNS[filters.get("order_by", "timestamp")]
+    while True:
+        page = store.query(limit=page_size, after=after, **filters)
+        assert len(page) <= page_size
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        after = (page[-1][column], page[-1][0])
+
+
+@pytest.mark.parametrize("order_by", sorted(COLUMNS))
+@pytest.mark.parametrize("descending", [True, False])
+def test_pages_cover_every_row_once_in_order(store, order_by, descending):
+    store.add_many(make_records(50))
+    rows = all_pages(store, 7, order_by=order_by, descending=descending)
+
+    assert len(rows) == 50
+    assert len({row[0] for row in rows}) == 50
+    keys = [(row[COLUMNS[order_by]], row[0]) for row in rows]
+    assert keys == sorted(keys, reverse=descending)
+
+
+def test_pages_respect_filters(store):
+    store.add_many(make_records(60))
+    rows = all_pages(store, 5, label="Monkeypox", min_confidence=70,
+                     date_from="2024-01-01", date_to="2024-01-01")
+
+    expected = [r for r in store.query(limit=1000)
+                if r[3] == "Monkeypox" and r[4] >= 70 and r[1] <= "2024-01-01 23:59:59"]
+    assert [row[0] for row in rows] == [row[0] for row in expected]
+    assert rows
+
+
+@pytest.mark.parametrize("order_by", results_store.SORT_COLUMNS)
+@pytest.mark.parametrize("descending", [True, False])
+def test_every_sort_column_pages_from_an_index(store, order_by, descending):
+    direction = "DESC" if descending else "ASC"
+    for where, params in (("", []), (f" WHERE ({order_by}, id) < (?, ?)", ["x", 1])):
+        plan = store._conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM results{where} "
+            f"ORDER BY {order_by} {direction}, id {direction} LIMIT 10", params
+        ).fetchall()
+        assert not any("TEMP B-TREE" in row[-1] for row in plan), plan
+
+
+def test_unknown_sort_column_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.query(order_by="probability; DROP TABLE results")
+
+
+class RecordingStore:
+    """Stands in for ResultsStore and remembers every transaction"""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    def add_many(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("database is locked")
+        self.batches.append(list(records))
+
+
+def test_writer_groups_records_into_batches():
+    store = RecordingStore()
+    writer = BufferedResultWriter(store, max_batch=100, flush_interval=5)
+    writer.add_many(make_records(250))
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    assert sum(len(batch) for batch in store.batches) == 250
+    assert all(len(batch) <= 100 for batch in store.batches)
+    assert len(store.batches) <= 4
+    assert writer.written == 250
+
+
+def test_writer_close_writes_the_buffer_and_rejects_more():
+    store = RecordingStore()
+    writer = BufferedResultWriter(store, max_batch=1000, flush_interval=60)
+    writer.add("a.jpg", 0.9)
+    writer.add("b.jpg", 0.1)
+    writer.close()
+
+    assert [record[1] for batch in store.batches for record in batch] == ["a.jpg", "b.jpg"]
+    with pytest.raises(RuntimeError):
+        writer.add("c.jpg", 0.5)
+    assert writer.flush(timeout=1)
+    writer.close()
+
+
+def test_writer_flush_reports_a_failed_batch_and_retries_it_on_the_timer():
+    store = RecordingStore(failures=1)
+    writer = BufferedResultWriter(store, max_batch=1000, flush_interval=0.05)
+    writer.add("a.jpg", 0.9)
+    assert not writer.flush(timeout=5)
+    assert writer.error is not None
+
+    # No further records arrive; the timer alone retries the batch
+    deadline = time.monotonic() + 5
+    while not store.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [record[1] for batch in store.batches for record in batch] == ["a.jpg"]
+    assert writer.flush(timeout=5)
+    assert writer.error is None
+    writer.close()
+
+
+def test_writer_reports_each_commit_without_a_flush():
+    store = RecordingStore(failures=1)
+    commits = []
+    committed = threading.Event()
+
+    def on_commit(count):
+        commits.append(count)
+        committed.set()
+
+    writer = BufferedResultWriter(store, max_batch=1000, flush_interval=0.01, on_commit=on_commit)
+    writer.add_many(make_records(3))
+    assert committed.wait(5)
+    writer.close()
+    # The failed first attempt is not reported, the retry is
+    assert commits == [3]
+    assert store.batches == [make_records(3)]
+
+
+def test_writer_close_raises_if_results_stay_unwritten():
+    store = RecordingStore(failures=10)
+    writer = BufferedResultWriter(store, max_batch=1000, flush_interval=0.01, close_attempts=3)
+    writer.add("a.jpg", 0.9)
+    with pytest.raises(RuntimeError, match="1 results could not be written"):
+        writer.close()
+    assert store.failures <= 10 - 3
+    assert [record[1] for record in writer.unwritten] == ["a.jpg"]
+    assert not writer.flush(timeout=1)
+
+
+class SlowQueue(queue.Queue):
+    """Widens the gap between a producer's closed check and its put"""
+
+    def put(self, item, *args, **kwargs):
+        if isinstance(item, tuple):
+            time.sleep(0.0005)
+        super().put(item, *args, **kwargs)
+
+
+def test_writer_never_drops_accepted_records_when_closed_concurrently(monkeypatch):
+    monkeypatch.setattr(results_store, "queue", types.SimpleNamespace(Queue=SlowQueue, Empty=queue.Empty))
+    store = RecordingStore()
+    writer = BufferedResultWriter(store, max_batch=64, flush_interval=0.01)
+    accepted = [0] * 8
+
+    def produce(slot):
+        while True:
+            try:
+                writer.add(f"{slot}.jpg", 0.5)
+            except RuntimeError:
+                return
+            accepted[slot] += 1
+
+    threads = [threading.Thread(target=produce, args=(slot,)) for slot in range(len(accepted))]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    writer.close()
+    for thread in threads:
+        thread.join()
+
+    assert sum(accepted) > 0
+    assert sum(len(batch) for batch in store.batches) == sum(accepted)
+
+
+def test_writer_commits_to_a_real_store(store):
+    writer = BufferedResultWriter(store, max_batch=8, flush_interval=0.01)
+    writer.add_many(make_records(20))
+    writer.close()
+    assert store.count() == 20
+
+
+def test_incremental_stats_match_a_full_rebuild(store):
+    records = make_records(90)
+    for start in range(0, len(records), 7):
+        store.add_many(records[start:start + 7])
+    incremental = store.stats()
+    daily = store.daily_counts(days=100)
+
+    assert store.rebuild_stats() == 90
+    rebuilt = store.stats()
+    assert rebuilt["total"] == incremental["total"] == 90
+    assert rebuilt["detections"] == incremental["detections"] == \
+        sum(record[3] == "Monkeypox" for record in records)
+    assert rebuilt["mean_probability"] == pytest.approx(incremental["mean_probability"])
+    assert rebuilt["rolling_mean_probability"] == pytest.approx(incremental["rolling_mean_probability"])
+    assert store.daily_counts(days=100) == daily
+    assert sum(total for _, total, _ in daily) == 90
+
+
+def test_rolling_mean_weights_recent_results(store):
+    store.add_many([make_record(f"{i}.jpg", 0.0) for i in range(100)])
+    store.add_many([make_record(f"late{i}.jpg", 1.0) for i in range(20)])
+    stats = store.stats()
+    assert stats["mean_probability"] == pytest.approx(20 / 120)
+    assert stats["rolling_mean_probability"] > 0.5
+
+
+def test_stats_of_an_empty_store(store):
+    stats = store.stats()
+    assert stats["total"] == 0
+    assert stats["mean_probability"] is None
+    assert stats["rolling_mean_probability"] is None
+
+
+def test_stats_survive_reopening(tmp_path):
+    path = str(tmp_path / "results.db")
+    first = ResultsStore(path)
+    first.add_many(make_records(10))
+    expected = first.stats()
+    first.close()
+
+    reopened = ResultsStore(path)
+    assert reopened.stats() == expected
+    reopened.close()
@@ -0,0 +1,270 @@
+# test_service.py
+import asyncio
+import json
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import service
+from service import PredictionService
+
+
+class FakeEngine:
+    """Answers with the mean pixel value and records the size of every batch"""
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+        self.entered = threading.Event()
+
+    def load(self):
+        pass
+
+    def status_text(self):
+        return "fake model"
+
+    def predict_batch(self, batch):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(len(batch))
+        return [float(image.mean()) for image in batch]
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.records = []
+
+    def add_many(self, records):
+        self.records.extend(records)
+
+
+def fake_decode(data):
+    # Bytes of b"bad" are unreadable; anything else becomes a flat image of its first byte
+    if data == b"bad":
+        return None
+    return f"hash-{data.hex()}", np.full((4, 4, 3), data[0] / 255, dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def no_image_decoding(monkeypatch):
+    monkeypatch.setattr(service, "decode_image_bytes", fake_decode)
+
+
+async def request(port, method, target, body=b"", content_type=None):
+    """Send one HTTP request to the local service; returns (status, headers, json body)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = [f"{method} {target} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}"]
+    if content_type:
+        head.append(f"Content-Type: {content_type}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, json.loads(payload)
+
+
+def multipart(files):
+    boundary = "test-boundary"
+    body = b""
+    for name, data in files:
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+                 "Content-Type: application/octet-stream\r\n\r\n").encode() + data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def run_service(test, engine=None, **options):
+    """Start a service on a free localhost port, run test(service, port) and shut it down"""
+    async def main():
+        svc = PredictionService(engine or FakeEngine(), RecordingWriter(), **options)
+        server = await svc.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await test(svc, port)
+        finally:
+            await svc.close()
+    return asyncio.run(main())
+
+
+def test_predict_returns_a_result_and_records_it():
+    async def test(svc, port):
+        status, _, body = await request(port, "POST", "/predict?name=a.jpg", b"\xff")
+        assert status == 200
+        assert body["image"] == "a.jpg"
+        assert body["prediction"] == "Monkeypox"
+        assert body["probability"] == pytest.approx(1.0)
+        assert [record[1] for record in svc.writer.records] == ["a.jpg"]
+
+    run_service(test)
+
+
+def test_concurrent_requests_are_coalesced_into_one_batch():
+    async def test(svc, port):
+        results = await asyncio.gather(*(request(port, "POST", f"/predict?name={i}", bytes([i]))
+                                         for i in range(8)))
+        assert all(status == 200 for status, _, _ in results)
+        assert sum(svc.engine.batches) == 8
+        assert len(svc.engine.batches) < 8
+
+    run_service(test, max_batch=32, max_wait_ms=200)
+
+
+def test_batch_endpoint_reports_undecodable_files():
+    async def test(svc, port):
+        body, content_type = multipart([("good.jpg", b"\x10"), ("bad.jpg", b"bad")])
+        status, _, result = await request(port, "POST", "/predict/batch", body, content_type)
+        assert status == 200
+        assert [r["image"] for r in result["results"]] == ["good.jpg", "bad.jpg"]
+        assert "error" in result["results"][1]
+
+    run_service(test)
+
+
+def test_full_queue_gets_503_with_retry_after():
+    gate = threading.Event()
+    engine = FakeEngine(gate)
+
+    async def test(svc, port):
+        loop = asyncio.get_running_loop()
+        first = asyncio.ensure_future(request(port, "POST", "/predict", b"\x01"))
+        await loop.run_in_executor(None, engine.entered.wait, 5)
+        waiting = asyncio.ensure_future(request(port, "POST", "/predict", b"\x02"))
+        while svc.scheduler.pending() < 1:
+            await asyncio.sleep(0.01)
+
+        # The image being predicted still holds its place in the queue
+        status, headers, body = await request(port, "POST", "/predict", b"\x04")
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+
+        gate.set()
+        assert all(status == 200 for status, _, _ in await asyncio.gather(first, waiting))
+        assert svc.in_flight == 0 and svc.buffered == 0
+
+    try:
+        run_service(test, engine, max_batch=1, max_wait_ms=0, queue_size=2)
+    finally:
+        gate.set()
+
+
+def test_concurrent_requests_are_refused_before_decoding(monkeypatch):
+    release = threading.Event()
+    decoded = []
+
+    def slow_decode(data):
+        decoded.append(data)
+        release.wait(5)
+        return fake_decode(data)
+
+    monkeypatch.setattr(service, "decode_image_bytes", slow_decode)
+
+    async def test(svc, port):
+        # Each request fits the queue on its own, but not all at once
+        body, content_type = multipart([(f"{i}.jpg", bytes([i + 1])) for i in range(3)])
+        admitted = asyncio.ensure_future(request(port, "POST", "/predict/batch", body, content_type))
+        while svc.in_flight < 3:
+            await asyncio.sleep(0.01)
+
+        status, _, _ = await request(port, "POST", "/predict/batch", body, content_type)
+        assert status == 503
+        assert len(decoded) <= 3
+
+        release.set()
+        assert (await admitted)[0] == 200
+
+    try:
+        run_service(test, queue_size=4, decode_workers=4)
+    finally:
+        release.set()
+
+
+def test_full_queue_is_refused_before_the_body_is_read():
+    gate = threading.Event()
+    engine = FakeEngine(gate)
+
+    async def test(svc, port):
+        loop = asyncio.get_running_loop()
+        first = asyncio.ensure_future(request(port, "POST", "/predict", b"\x01"))
+        await loop.run_in_executor(None, engine.entered.wait, 5)
+
+        # Announce a large body but never send it: the answer must not wait for it
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /predict HTTP/1.1\r\nContent-Length: 1000000\r\n\r\n")
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        assert response.startswith(b"HTTP/1.1 503")
+        assert svc.buffered == 1  # only the admitted request
+
+        gate.set()
+        assert (await first)[0] == 200
+
+    try:
+        run_service(test, engine, max_batch=1, max_wait_ms=0, queue_size=1)
+    finally:
+        gate.set()
+
+
+def test_connections_beyond_the_limit_get_503():
+    async def test(svc, port):
+        idle_reader, idle_writer = await asyncio.open_connection("127.0.0.1", port)
+        while svc.connections < 1:
+            await asyncio.sleep(0.01)
+        status, headers, _ = await request(port, "POST", "/predict", b"\x01")
+        assert status == 503 and headers["Retry-After"] == "1"
+
+        idle_writer.close()
+        while svc.connections:
+            await asyncio.sleep(0.01)
+        assert (await request(port, "POST", "/predict", b"\x01"))[0] == 200
+
+    run_service(test, max_connections=1)
+
+
+def test_uploads_beyond_the_buffer_budget_get_503():
+    async def test(svc, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /predict HTTP/1.1\r\nContent-Length: 8\r\n\r\n")
+        await writer.drain()
+        while svc.buffered < 8:
+            await asyncio.sleep(0.01)
+
+        assert (await request(port, "POST", "/predict", b"\x01\x02\x03"))[0] == 503
+        writer.write(b"\x01" * 8)
+        response = await reader.read()
+        writer.close()
+        assert response.startswith(b"HTTP/1.1 200")
+
+    run_service(test, max_buffered_bytes=10)
+
+
+def test_request_larger_than_the_queue_gets_413_even_when_idle():
+    async def test(svc, port):
+        body, content_type = multipart([(f"{i}.jpg", bytes([i])) for i in range(5)])
+        status, headers, result = await request(port, "POST", "/predict/batch", body, content_type)
+        assert status == 413
+        assert "Retry-After" not in headers
+        assert "4" in result["error"]
+        assert svc.engine.batches == []
+
+        body, content_type = multipart([(f"{i}.jpg", bytes([i])) for i in range(4)])
+        status, _, _ = await request(port, "POST", "/predict/batch", body, content_type)
+        assert status == 200
+
+    run_service(test, queue_size=4)
+
+
+def test_unknown_routes_and_methods():
+    async def test(svc, port):
+        assert (await request(port, "GET", "/nope"))[0] == 404
+        assert (await request(port, "GET", "/predict"))[0] == 405
+        status, _, health = await request(port, "GET", "/health")
+        assert status == 200 and health["model"] == "fake model"
+
+    run_service(test)
@@ -0,0 +1,53 @@
+# test_worker.py
+import threading
+import time
+
+from worker import BackgroundWorker
+
+
+class FakeRoot:
+    """Just enough of a Tk root for BackgroundWorker; callbacks are never run"""
+
+    def after(self, delay, callback):
+        pass
+
+
+def test_shutdown_waits_for_a_running_job_to_stop_at_its_next_report():
+    worker = BackgroundWorker(FakeRoot())
+    started = threading.Event()
+    batches = []
+
+    def job(progress):
+        started.set()
+        for batch in range(1000):
+            time.sleep(0.01)
+            batches.append(batch)
+            progress(batch)
+
+    worker.submit(job)
+    started.wait(5)
+    start = time.perf_counter()
+    worker.shutdown(wait=True)
+
+    assert time.perf_counter() - start < 1
+    finished = len(batches)
+    time.sleep(0.05)
+    assert len(batches) == finished < 1000
+
+
+def test_shutdown_drops_jobs_that_have_not_started():
+    worker = BackgroundWorker(FakeRoot())
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def blocking_job(progress):
+        started.set()
+        release.wait(5)
+
+    worker.submit(blocking_job)
+    worker.submit(lambda progress: ran.append(True))
+    started.wait(5)
+    worker.shutdown()
+    release.set()
+    worker.executor.shutdown(wait=True)
+    assert ran == []
@@ -0,0 +1,137 @@
+# training_config.py
+import contextlib
+import json
+import os
+import time
+
+import tensorflow as tf
+
+DEFAULT_CONFIG = {
+    "batch_size": 32,
+    "epochs": 20,
+    "learning_rate": 0.001,
+    "head": "flatten",
+    "dropout": 0.5,           # dropout rate before the output layer
+    "cache": None,            # None, "memory" or a cache directory
+    "shards_dir": None,       # stream preprocessed shards instead of JPEGs
+    "intra_op_threads": 0,    # 0 lets TensorFlow pick (one per core)
+    "inter_op_threads": 0,
+    "mixed_precision": "auto",  # "auto" uses bfloat16 only if the CPU supports it
+    "xla": False,
+    "model_path": "monkeypox_model.h5",
+    "checkpoint_dir": "checkpoints",  # None disables checkpoints and resuming
+    "resume": True,           # continue from the last checkpoint of an interrupted run
+    "early_stopping_patience": 5  # epochs without val_loss improvement; 0 disables
+}
+
+
+def load_config(source=None, **overrides):
+    """Build a training config from the defaults, a JSON file or dict, and keyword overrides
+
+    Overrides that are None are ignored so argparse defaults don't mask the file.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if isinstance(source, dict):
+        config.update(source)
+    elif source:
+        with open(source) as file:
+            config.update(json.load(file))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown training config keys: {', '.join(sorted(unknown))}")
+    return config
+
+
+def cpu_supports_bfloat16():
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo") as file:
+            flags = file.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def apply_runtime_config(config):
+    """Apply threading and precision settings; call before building any model
+
+    XLA is switched on per model through compile_model(jit_compile=...).
+    Returns the name of the Keras precision policy in use.
+    """
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(config["intra_op_threads"])
+        tf.config.threading.set_inter_op_parallelism_threads(config["inter_op_threads"])
+    except RuntimeError:
+        print("Warning: TensorFlow is already initialized, thread pool sizes were not changed")
+
+    mixed = config["mixed_precision"]
+    if mixed == "auto":
+        mixed = cpu_supports_bfloat16()
+    policy = "mixed_bfloat16" if mixed else "float32"
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+
+def split_cores(tasks, workers=None):
+    """(processes, threads per process, cores) for training tasks side by side in worker processes
+
+    By default half the cores get a process each, but never more processes
+    than tasks; the cores are shared evenly so the CPU is not oversubscribed.
+    """
+    cores = os.cpu_count() or 1
+    workers = workers or min(tasks, max(1, cores // 2))
+    return workers, max(1, cores // workers), cores
+
+
+def worker_config(config, threads):
+    """Copy of config for one worker process: its share of the cores and no checkpoints"""
+    return dict(config, intra_op_threads=threads, inter_op_threads=1, checkpoint_dir=None)
+
+
+@contextlib.contextmanager
+def child_thread_limit(threads):
+    """Cap the OpenMP threads of every process started inside the block
+
+    Spawned worker processes import TensorFlow, and with it the OpenMP
+    runtime, before a pool initializer runs, so the limit has to be in the
+    environment they inherit. The parent's own runtime is unaffected.
+    """
+    previous = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["OMP_NUM_THREADS"]
+        else:
+            os.environ["OMP_NUM_THREADS"] = previous
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Prints training images per second at the end of every epoch"""
+
+    def __init__(self, batch_size):
+        super().__init__()
+        self.batch_size = batch_size
+        self.history = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._steps = 0
+        self._start = self._last_step = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._steps += 1
+        self._last_step = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Validation runs after the last training step and is not counted
+        elapsed = self._last_step - self._start
+        # The last batch may be partial, so this slightly overestimates
+        images_per_second = self._steps * self.batch_size / elapsed if elapsed > 0 else 0.0
+        self.history.append(images_per_second)
+        if logs is not None:
+            logs["images_per_second"] = images_per_second
+        print(f"Epoch {epoch + 1}: {images_per_second:.1f} images/s "
+              f"({self._steps} steps in {elapsed:.1f}s, {os.cpu_count()} CPUs)")
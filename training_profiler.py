@@ -0,0 +1,168 @@
+# training_profiler.py
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import build_datasets, list_dataset_files, make_dataset, split_files
+from dataset_shards import ShardReader, build_shard_datasets, build_shards, shard_dataset
+from model import HEADS, compile_model, create_model
+from training_config import apply_runtime_config, load_config
+
+PROFILE_DIR = "logs/profile"
+WARMUP_STEPS = 3             # first steps include graph tracing and are not counted
+INPUT_BOUND_FRACTION = 0.1   # data wait above this share of a step means the input is the bottleneck
+
+ADVICE = {
+    "decode": "JPEGs are decoded every epoch; try --cache memory or --shards-dir",
+    "shard read": "reading shards is slow; put them on faster storage or use --cache memory",
+    "augment": "batch augmentation is slower than the model; raise --inter-op-threads",
+    "compute": "the model is the bottleneck; try --head gap, --mixed-precision on or --xla"
+}
+
+
+def time_steps(model, dataset, steps, trace_window=None, logdir=PROFILE_DIR):
+    """Run training steps and return per-step (data wait, compute) seconds
+
+    trace_window is a (first, last) step range captured with the TensorBoard
+    profiler into logdir (view with: tensorboard --logdir <logdir>).
+    """
+    waits, computes = [], []
+    iterator = iter(dataset.repeat())
+    tracing = False
+    try:
+        for step in range(steps):
+            if trace_window and step == trace_window[0]:
+                tf.profiler.experimental.start(logdir)
+                tracing = True
+
+            start = time.perf_counter()
+            images, labels = next(iterator)
+            fetched = time.perf_counter()
+            with tf.profiler.experimental.Trace("train", step_num=step, _r=1):
+                # train_on_batch returns numpy values, so the step has finished
+                model.train_on_batch(images, labels)
+            done = time.perf_counter()
+            waits.append(fetched - start)
+            computes.append(done - fetched)
+
+            if tracing and step == trace_window[1]:
+                tf.profiler.experimental.stop()
+                tracing = False
+    finally:
+        if tracing:
+            tf.profiler.experimental.stop()
+    return np.asarray(waits), np.asarray(computes)
+
+
+def _seconds_per_batch(dataset, batches):
+    """Iterate a dataset on its own; the first batch is not timed"""
+    iterator = iter(dataset)
+    next(iterator)
+    count = 0
+    start = time.perf_counter()
+    for _ in range(batches - 1):
+        try:
+            next(iterator)
+        except StopIteration:
+            break
+        count += 1
+    return (time.perf_counter() - start) / max(count, 1)
+
+
+def time_input_stages(dataset_path, batch_size=32, batches=20, shards_dir=None):
+    """Seconds per batch spent loading images and augmenting them, measured without the model"""
+    if shards_dir:
+        build_shards(dataset_path, shards_dir)
+        reader = ShardReader(shards_dir)
+        indices = list(range(min(len(reader), batch_size * batches)))
+        load_stage = "shard read"
+        make = lambda augment: shard_dataset(reader, indices, batch_size, training=True, augment=augment)
+    else:
+        paths, labels = list_dataset_files(dataset_path)
+        (paths, labels), _ = split_files(paths, labels, 0.2)
+        paths, labels = paths[:batch_size * batches], labels[:batch_size * batches]
+        load_stage = "decode"
+        make = lambda augment: make_dataset(paths, labels, batch_size, training=True, augment=augment)
+
+    load = _seconds_per_batch(make(False), batches)
+    load_and_augment = _seconds_per_batch(make(True), batches)
+    return {load_stage: load, "augment": max(load_and_augment - load, 0.0)}
+
+
+def profile_training(dataset_path, config=None, steps=50, trace_window=(10, 15),
+                     logdir=PROFILE_DIR, **overrides):
+    """Profile a short training run and report whether input or compute is the bottleneck
+
+    Nothing is saved apart from the profiler trace. Returns the report dict.
+    """
+    config = load_config(config, **overrides)
+    policy = apply_runtime_config(config)
+    batch_size = config["batch_size"]
+
+    if config["shards_dir"]:
+        train_dataset, _ = build_shard_datasets(dataset_path, config["shards_dir"], batch_size=batch_size)
+    else:
+        train_dataset, _ = build_datasets(dataset_path, batch_size=batch_size, cache=config["cache"])
+    model = compile_model(create_model(head=config["head"], dropout=config["dropout"]),
+                          learning_rate=config["learning_rate"],
+                          jit_compile=config["xla"])
+
+    waits, computes = time_steps(model, train_dataset, steps + WARMUP_STEPS, trace_window, logdir)
+    waits, computes = waits[WARMUP_STEPS:], computes[WARMUP_STEPS:]
+    stages = time_input_stages(dataset_path, batch_size, shards_dir=config["shards_dir"])
+
+    step_time = waits.mean() + computes.mean()
+    wait_fraction = waits.mean() / step_time if step_time > 0 else 0.0
+    if wait_fraction > INPUT_BOUND_FRACTION:
+        bottleneck = max(stages, key=stages.get)
+    else:
+        bottleneck = "compute"
+
+    report = {
+        "steps": len(waits),
+        "batch_size": batch_size,
+        "policy": policy,
+        "data_wait_ms": float(waits.mean() * 1000),
+        "compute_ms": float(computes.mean() * 1000),
+        "data_wait_fraction": float(wait_fraction),
+        "images_per_second": float(batch_size / step_time) if step_time > 0 else 0.0,
+        "stage_ms_per_batch": {name: seconds * 1000 for name, seconds in stages.items()},
+        "bottleneck": bottleneck,
+        "trace_dir": logdir if trace_window else None
+    }
+
+    print(f"Profiled {report['steps']} steps of {batch_size} images ({policy}, "
+          f"{report['images_per_second']:.1f} images/s)")
+    print(f"  data wait  {report['data_wait_ms']:8.1f} ms/step ({wait_fraction:.0%})")
+    print(f"  compute    {report['compute_ms']:8.1f} ms/step ({1 - wait_fraction:.0%})")
+    print("Input pipeline on its own:")
+    for name, ms in report["stage_ms_per_batch"].items():
+        print(f"  {name:10s} {ms:8.1f} ms/batch")
+    print(f"Bottleneck: {bottleneck} - {ADVICE[bottleneck]}")
+    if trace_window:
+        print(f"Trace of steps {trace_window[0]}-{trace_window[1]} written to {logdir} "
+              f"(tensorboard --logdir {logdir})")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the bottleneck of a short training run")
+    parser.add_argument("dataset_path", nargs="?", default="data/dataset")
+    parser.add_argument("--config", help="JSON file with training settings")
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--trace-steps", nargs=2, type=int, default=[10, 15], metavar=("FIRST", "LAST"),
+                        help="Steps to capture with the TensorBoard profiler")
+    parser.add_argument("--no-trace", action="store_true")
+    parser.add_argument("--logdir", default=PROFILE_DIR)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--head", choices=HEADS)
+    parser.add_argument("--cache", help='"memory" or a cache directory')
+    parser.add_argument("--shards-dir")
+    args = parser.parse_args()
+
+    profile_training(args.dataset_path, args.config, args.steps,
+                     None if args.no_trace else tuple(args.trace_steps), args.logdir,
+                     batch_size=args.batch_size, head=args.head, cache=args.cache,
+                     shards_dir=args.shards_dir)
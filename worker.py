@@ -0,0 +1,95 @@
+# worker.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once the worker is shutting down"""
+
+
+class BackgroundWorker:
+    """Runs jobs in a thread pool and delivers progress and results on the Tk main thread
+
+    Jobs never touch widgets directly. They report through a queue that the
+    Tk event loop drains with after(), so the window stays responsive while
+    the CNN is running.
+    """
+
+    def __init__(self, root, max_workers=1, poll_interval=50):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="monkeypox-worker")
+        self.messages = queue.Queue()
+        self.callbacks = {}
+        self._next_job = 0
+        self._lock = threading.Lock()
+        self._polling = False
+        self._closed = False
+
+    def submit(self, func, *args, on_progress=None, on_done=None, on_error=None):
+        """Run func(*args, progress=callback) in the pool and return the job id"""
+        with self._lock:
+            job_id = self._next_job
+            self._next_job += 1
+        self.callbacks[job_id] = (on_progress, on_done, on_error)
+
+        def report(value, text=None):
+            if self._closed:
+                raise JobCancelled()
+            self.messages.put(("progress", job_id, (value, text)))
+
+        def run():
+            try:
+                result = func(*args, progress=report)
+            except Exception as e:
+                self.messages.put(("error", job_id, e))
+            else:
+                self.messages.put(("done", job_id, result))
+
+        self.executor.submit(run)
+        self._schedule_poll()
+        return job_id
+
+    def pending(self):
+        """Number of submitted jobs whose results have not been delivered yet"""
+        return len(self.callbacks)
+
+    def _schedule_poll(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        """Drain the message queue and dispatch callbacks (Tk main thread only)"""
+        self._polling = False
+        while True:
+            try:
+                kind, job_id, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "progress":
+                on_progress = self.callbacks.get(job_id, (None, None, None))[0]
+                if on_progress:
+                    on_progress(*payload)
+                continue
+
+            _, on_done, on_error = self.callbacks.pop(job_id, (None, None, None))
+            if kind == "done" and on_done:
+                on_done(payload)
+            elif kind == "error" and on_error:
+                on_error(payload)
+
+        if self.callbacks:
+            self._schedule_poll()
+
+    def shutdown(self, wait=False):
+        """Stop accepting work and drop jobs that have not started
+
+        Running jobs stop at their next progress report. With wait, this
+        returns once they have.
+        """
+        self._closed = True
+        self.executor.shutdown(wait=wait, cancel_futures=True)